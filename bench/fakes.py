@@ -0,0 +1,194 @@
+"""Локальные заглушки Todoist, Gemini и Telegram Bot API для бенчмарков.
+
+Каждая заглушка — aiohttp-приложение с настраиваемой задержкой и долей
+ошибок, чтобы гонять настоящий код бота без сети.
+"""
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+
+@dataclass
+class Upstream:
+    latency: float = 0.05
+    jitter: float = 0.02
+    error_rate: float = 0.0
+    calls: Dict[str, int] = field(default_factory=dict)
+
+    async def delay(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def failed(self) -> bool:
+        return random.random() < self.error_rate
+
+
+class FakeTodoist(Upstream):
+    """REST v2 projects/tasks и /sync/v9/completed/get_all с пагинацией"""
+
+    def __init__(self, tasks_per_user: int = 50, projects: int = 8, **kwargs):
+        super().__init__(**kwargs)
+        self.tasks_per_user = tasks_per_user
+        self.projects = [
+            {"id": str(i), "name": f"{700 + i}. Project{i} (https://example.com/{i})"}
+            for i in range(projects)
+        ]
+        self._completed: Dict[str, List[dict]] = {}
+
+    def completed_for(self, token: str) -> List[dict]:
+        items = self._completed.get(token)
+        if items is None:
+            now = datetime.now(timezone.utc)
+            rng = random.Random(token)
+            items = []
+            for i in range(self.tasks_per_user):
+                completed_at = now - timedelta(minutes=rng.randint(0, 29 * 24 * 60))
+                items.append({
+                    "id": f"{token}-{i}",
+                    "task_id": str(i),
+                    "content": f"Задача {i % 37} по фиче {rng.randint(0, 20)}",
+                    "project_id": str(i % len(self.projects)),
+                    "completed_at": completed_at.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+                })
+            items.sort(key=lambda item: item["completed_at"], reverse=True)
+            self._completed[token] = items
+        return items
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/rest/v2/projects", self.get_projects)
+        app.router.add_get("/rest/v2/tasks", self.get_tasks)
+        app.router.add_get("/sync/v9/completed/get_all", self.get_completed)
+        app.router.add_post("/sync/v9/sync", self.sync)
+        return app
+
+    async def _guard(self, request: web.Request, name: str):
+        await self.delay(name)
+        if self.failed():
+            raise web.HTTPServiceUnavailable()
+        return request.headers.get("Authorization", "").removeprefix("Bearer ")
+
+    async def get_projects(self, request: web.Request) -> web.Response:
+        await self._guard(request, "projects")
+        return web.json_response(self.projects)
+
+    async def get_tasks(self, request: web.Request) -> web.Response:
+        await self._guard(request, "tasks")
+        return web.json_response([])
+
+    async def get_completed(self, request: web.Request) -> web.Response:
+        token = await self._guard(request, "completed")
+        since = request.query.get("since", "")
+        limit = int(request.query.get("limit", 30))
+        offset = int(request.query.get("offset", 0))
+        items = [item for item in self.completed_for(token) if item["completed_at"][:19] >= since]
+        return web.json_response({"items": items[offset:offset + limit]})
+
+    async def sync(self, request: web.Request) -> web.Response:
+        await self._guard(request, "sync")
+        commands = (await request.json())["commands"]
+        if len(commands) > 100:
+            raise web.HTTPBadRequest(text="Too many commands")
+        statuses, mapping = {}, {}
+        for command in commands:
+            if self.failed():
+                statuses[command["uuid"]] = {"error_code": 42, "error": "Invalid argument value"}
+            else:
+                statuses[command["uuid"]] = "ok"
+                mapping[command["temp_id"]] = str(random.getrandbits(48))
+        return web.json_response({"sync_status": statuses, "temp_id_mapping": mapping})
+
+
+class FakeGemini(Upstream):
+    """generateContent и streamGenerateContent (SSE)"""
+
+    def __init__(self, chunks: int = 5, **kwargs):
+        super().__init__(**kwargs)
+        self.chunks = chunks
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1beta/models/{model}", self.generate)
+        return app
+
+    @staticmethod
+    def _text(prompt: str) -> str:
+        lines = [line for line in prompt.splitlines() if line.startswith("Проект:")]
+        return "\n\n".join(f"{line[8:]} - сделал задачи, доработал фичи" for line in lines) or "Резюме"
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        await self.delay("generate")
+        if self.failed():
+            return web.Response(status=429, headers={"Retry-After": "0.1"})
+
+        text = self._text(payload["contents"][0]["parts"][0]["text"])
+        if not request.match_info["model"].endswith(":streamGenerateContent"):
+            return web.json_response({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        step = max(1, len(text) // self.chunks)
+        for i in range(0, len(text), step):
+            chunk = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}]}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n".encode())
+            await asyncio.sleep(self.latency / self.chunks)
+        return response
+
+
+class FakeTelegram(Upstream):
+    """Bot API: отвечает на методы, которые бот вызывает при генерации отчёта.
+
+    Апдейты из updates отдаются на первый же getUpdates — для polling-режима.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("latency", 0.01)
+        super().__init__(**kwargs)
+        self.sent: List[dict] = []
+        self.updates: List[dict] = []
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        return app
+
+    async def method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        await self.delay(method)
+
+        if method in ("editMessageText", "sendMessage", "sendDocument"):
+            self.sent.append({"method": method, **data})
+            chat_id = int(data.get("chat_id", 0))
+            result = {
+                "message_id": int(data.get("message_id", 1)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", "")
+            }
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench"}
+        elif method == "getUpdates":
+            result, self.updates = self.updates, []
+            if not result:
+                await asyncio.sleep(min(float(data.get("timeout", 0)), 1.0))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+async def serve(app: web.Application, port: int = 0) -> Tuple[web.AppRunner, str]:
+    """Поднимает приложение на 127.0.0.1 и возвращает (runner, base_url)"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
@@ -0,0 +1,188 @@
+"""Нагрузочный тест генерации отчётов целиком: Dispatcher -> cb_generate_report -> Todoist/Gemini/Telegram.
+
+Все внешние сервисы заменены локальными заглушками из bench/fakes.py.
+Результат (p50/p95/p99 и пропускная способность) печатается и сохраняется
+в bench/results/<commit>-<время>.json для сравнения между коммитами:
+
+    python -m bench.loadtest --users 200 --rounds 3
+    python -m bench.loadtest --users 200 --compare bench/results/<старый>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.fakes import FakeTodoist, FakeGemini, FakeTelegram, serve
+
+RESULTS_DIR = Path(__file__).parent / "results"
+BOT_TOKEN = "123456:bench"
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "📊 Отчёты по Todoist"
+            }
+        }
+    }
+
+
+async def run(args) -> dict:
+    todoist = FakeTodoist(tasks_per_user=args.tasks, latency=args.todoist_latency, error_rate=args.error_rate)
+    gemini = FakeGemini(latency=args.gemini_latency, error_rate=args.error_rate)
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    runners = []
+    for fake, env in ((todoist, "TODOIST_API_BASE"), (gemini, "GEMINI_API_BASE"), (telegram, "TELEGRAM_API_BASE")):
+        runner, url = await serve(fake.app())
+        runners.append(runner)
+        os.environ[env] = url
+
+    workdir = tempfile.mkdtemp(prefix="todoistbot-bench-")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "users.db")
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    os.environ["GEMINI_API_KEY"] = "bench"
+    if args.no_cache:
+        os.environ["REPORT_CACHE_SIZE"] = "0"
+
+    # Импортируем бота только после того, как окружение указывает на заглушки
+    from aiogram import Dispatcher
+    from aiogram.types import Update
+    from bot.database import init_db, close_db, save_user_token
+    from bot.fsm_storage import SQLiteStorage
+    from bot.handlers import router
+    from bot.http_session import init_http, close_http
+    from bot.main import create_bot
+
+    await init_db()
+    await init_http()
+    bot = create_bot()
+    dp = Dispatcher(storage=SQLiteStorage())
+    dp.include_router(router)
+
+    user_ids = [100000 + i for i in range(args.users)]
+    for user_id in user_ids:
+        await save_user_token(user_id, f"token-{user_id}-" + "x" * 24)
+
+    latencies = []
+    errors = 0
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def user_session(user_id: int):
+        nonlocal errors
+        for round_no in range(args.rounds):
+            report_type = "monthly" if (user_id + round_no) % 2 else "daily"
+            update = Update.model_validate(
+                callback_update(next(update_ids), user_id, f"report:{report_type}"),
+                context={"bot": bot}
+            )
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[user_session(user_id) for user_id in user_ids])
+    elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    await close_http()
+    await close_db()
+    for runner in runners:
+        await runner.cleanup()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "params": vars(args),
+        "reports": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0
+        },
+        "upstream_calls": {
+            "todoist": todoist.calls,
+            "gemini": gemini.calls,
+            "telegram": telegram.calls
+        }
+    }
+
+
+def compare(current: dict, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nvs {baseline['commit']} ({baseline_path}):")
+    for key in ("p50", "p95", "p99"):
+        old, new = baseline["latency_s"][key], current["latency_s"][key]
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"  {key}: {old:.4f}s -> {new:.4f}s ({change:+.1f}%)")
+    old, new = baseline["throughput_rps"], current["throughput_rps"]
+    print(f"  throughput: {old} -> {new} reports/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--tasks", type=int, default=60, help="completed tasks per user in the 30-day window")
+    parser.add_argument("--todoist-latency", type=float, default=0.08)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the AI report cache")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"{result['commit']}-{result['timestamp']}.json"
+        path.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+        print(f"\nSaved to {path}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
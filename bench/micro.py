@@ -0,0 +1,194 @@
+"""Микробенчмарки отдельных узлов бота на локальных заглушках.
+
+    python -m bench.micro                # все сценарии
+    python -m bench.micro pagination db  # выборочно
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from bench.fakes import FakeTodoist, serve
+
+
+async def bench_pagination(items: int = 5000, latency: float = 0.05):
+    """Месячная выборка на тысячах выполненных задач: последовательно vs параллельно"""
+    todoist = FakeTodoist(tasks_per_user=items, latency=latency, jitter=0)
+    runner, url = await serve(todoist.app())
+
+    import bot.todoist_client as todoist_client
+    from bot.http_session import close_http
+    todoist_client.TODOIST_REST_URL = f"{url}/rest/v2"
+    todoist_client.TODOIST_SYNC_URL = f"{url}/sync/v9"
+
+    since = datetime.now() - timedelta(days=30)
+    for fanout in (1, todoist_client.COMPLETED_PAGE_FANOUT):
+        todoist_client.COMPLETED_PAGE_FANOUT = fanout
+        started = time.perf_counter()
+        tasks = await todoist_client.TodoistClient("bench").get_completed_tasks(since)
+        print(f"pagination fanout={fanout}: {len(tasks)} tasks in {time.perf_counter() - started:.3f}s")
+
+    await close_http()
+    await runner.cleanup()
+
+
+async def bench_db(users: int = 1000, lookups: int = 20000):
+    """Поиск токена: холодный (каждый раз в SQLite) и через кэш токенов"""
+    from bot import database
+
+    await database.init_db()
+    for user_id in range(users):
+        await database.save_user_token(user_id, "x" * 40)
+
+    ttl = database.TOKEN_CACHE_TTL
+    for label, cache_ttl in (("sqlite", 0), ("cached", ttl)):
+        database.TOKEN_CACHE_TTL = cache_ttl
+        started = time.perf_counter()
+        for i in range(lookups):
+            await database.get_user_token(i % users)
+        print(f"token lookups ({label}): {lookups / (time.perf_counter() - started):,.0f}/s")
+    database.TOKEN_CACHE_TTL = ttl
+
+    await database.close_db()
+
+
+async def bench_webhook(updates: int = 3000):
+    """Приём апдейтов webhook-сервером: сколько апдейтов в секунду он подтверждает"""
+    from aiohttp import ClientSession
+    from aiogram import Bot, Dispatcher, Router
+    from bot.webhook import WebhookHandler, create_app, SECRET_HEADER
+    from bot.config import WEBHOOK_PATH
+
+    bot = Bot("123456:bench")
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def echo(message):
+        await asyncio.sleep(0.01)
+
+    dp.include_router(router)
+    handler = WebhookHandler(dp, bot, "secret")
+    runner, url = await serve(create_app(handler))
+
+    async with ClientSession() as session:
+        async def post(update_id: int):
+            update = {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id, "date": 0, "text": "hi",
+                    "chat": {"id": 1, "type": "private"},
+                    "from": {"id": 1, "is_bot": False, "first_name": "bench"}
+                }
+            }
+            async with session.post(url + WEBHOOK_PATH, json=update, headers={SECRET_HEADER: "secret"}) as resp:
+                assert resp.status == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*[post(i) for i in range(updates)])
+        elapsed = time.perf_counter() - started
+
+    await handler.drain()
+    print(f"webhook ingest: {updates / elapsed:,.0f} updates/s")
+    await runner.cleanup()
+    await bot.session.close()
+
+
+@dataclass
+class PlainTaskInfo:
+    """Прежнее представление задачи: обычный dataclass с __dict__ и datetime"""
+    content: str
+    project_name: str
+    completed_at: Optional[datetime] = None
+    due_date: Optional[str] = None
+
+
+def bench_memory(tasks: int = 5000, projects: int = 12):
+    """Пиковая память на один месячный отчёт: строки из базы -> задачи -> фильтр -> текст промпта"""
+    from bot.ai_reports import filter_work_tasks, EXCLUDED_PROJECT_NAMES
+    from bot.compaction import compact_tasks
+    from bot.history import TIMESTAMP_FORMAT
+    from bot.todoist_client import TaskBatch
+
+    rng = random.Random(1)
+    now = datetime.now(timezone.utc)
+    # Имена как у настоящих проектов — с URL; карта проектов приходит из кэша, как в боте
+    names = {str(i): f"{700 + i}. Project{i} (https://example.com/projects/{i})" for i in range(projects)}
+    names[str(projects)] = "Inbox"
+    rows = [
+        (f"Задача {i % 97} по фиче {rng.randint(0, 50)}", str(rng.randint(0, projects)),
+         (now - timedelta(minutes=rng.randint(0, 30 * 24 * 60))).strftime(TIMESTAMP_FORMAT))
+        for i in range(tasks)
+    ]
+
+    def plain():
+        # Список dataclass-ов с разобранными временами, затем отфильтрованный список
+        items = [
+            PlainTaskInfo(content, names[project_id],
+                          datetime.strptime(completed_at, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc))
+            for content, project_id, completed_at in rows
+        ]
+        exclude = list(EXCLUDED_PROJECT_NAMES)
+        items = [t for t in items if t.project_name.lower() not in exclude]
+        return compact_tasks(items).text
+
+    def batch():
+        items = TaskBatch()
+        for content, project_id, completed_at in rows:
+            items.add(content, names[project_id], completed_at)
+        items = TaskBatch.from_tasks(filter_work_tasks(items))
+        return compact_tasks(items).text
+
+    for label, build in (("dataclass list", plain), ("TaskBatch", batch)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"report memory ({label}): peak {peak / 1024:,.0f} KiB, "
+              f"{peak / tasks:,.0f} B/task, {elapsed * 1000:.0f} ms for {tasks} tasks")
+
+
+def bench_compaction(tasks: int = 1000):
+    """Сжатие промпта на одном проекте без цифр в задачах — худший случай для поиска почти дублей"""
+    from bot.compaction import compact_tasks
+    from bot.todoist_client import TaskInfo
+
+    rng = random.Random(1)
+    words = ("сделал поправил проверил обновил экран логин оплата тесты баги "
+             "дизайн сборка релиз ui api бэкенд фронт онборд профиль").split()
+    items = [TaskInfo(" ".join(rng.choice(words) for _ in range(5)), "Project") for _ in range(tasks)]
+
+    started = time.perf_counter()
+    compacted = compact_tasks(items)
+    print(f"compaction: {tasks} digit-free tasks in one project -> {compacted.lines_count} lines "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+SCENARIOS = {
+    "pagination": bench_pagination,
+    "db": bench_db,
+    "webhook": bench_webhook,
+    "memory": bench_memory,
+    "compaction": bench_compaction,
+}
+
+
+def main():
+    os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="todoistbot-bench-"), "users.db"))
+    names = sys.argv[1:] or list(SCENARIOS)
+    for name in names:
+        result = SCENARIOS[name]()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Холодный старт бота: от запуска процесса до первого обработанного апдейта.
+
+Бот запускается отдельным процессом (`python -m bot.main polling`) против
+заглушек из bench/fakes.py; первый getUpdates отдаёт /help, старт считается
+законченным, когда заглушка Telegram получает ответ на него. Отдельно
+замеряется импорт кода бота поверх уже загруженных aiogram/aiohttp/aiosqlite —
+для него действует бюджет, при превышении скрипт завершается с кодом 1:
+
+    python -m bench.startup
+    python -m bench.startup --runs 5 --import-budget 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.fakes import FakeTodoist, FakeTelegram, serve
+
+ROOT = Path(__file__).parent.parent
+BOT_TOKEN = "123456:bench"
+
+# Импорт собственного кода бота (без сторонних библиотек), мс
+IMPORT_BUDGET_MS = 50
+
+IMPORT_PROBE = """
+import time
+import aiogram, aiogram.client.session.aiohttp, aiohttp, aiosqlite, dotenv
+started = time.perf_counter()
+import bot.main
+print(time.perf_counter() - started)
+"""
+
+
+def help_update(update_id: int) -> dict:
+    user = {"id": 1, "is_bot": False, "first_name": "bench"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": "/help",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+            "chat": {"id": 1, "type": "private"}, "from": user
+        }
+    }
+
+
+def child_env(**extra: str) -> dict:
+    env = dict(os.environ, BOT_TOKEN=BOT_TOKEN, PYTHONPATH=str(ROOT), **extra)
+    env.pop("METRICS_PORT", None)
+    return env
+
+
+async def first_update(timeout: float) -> float:
+    todoist_runner, todoist_url = await serve(FakeTodoist(latency=0.0, jitter=0).app())
+    telegram = FakeTelegram(latency=0.0, jitter=0)
+    telegram.updates.append(help_update(1))
+    telegram_runner, telegram_url = await serve(telegram.app())
+
+    env = child_env(
+        TELEGRAM_API_BASE=telegram_url,
+        TODOIST_API_BASE=todoist_url,
+        DATABASE_PATH=os.path.join(tempfile.mkdtemp(prefix="todoistbot-bench-"), "users.db")
+    )
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bot.main", "polling", cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while not telegram.sent:
+            if process.returncode is not None or time.perf_counter() - started > timeout:
+                raise RuntimeError("bot did not answer the first update")
+            await asyncio.sleep(0.005)
+        return time.perf_counter() - started
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        await telegram_runner.cleanup()
+        await todoist_runner.cleanup()
+
+
+def own_import_time() -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, env=child_env(), text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS, help="ms, bot's own modules")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    startups = [asyncio.run(first_update(args.timeout)) for _ in range(args.runs)]
+    imports = [own_import_time() for _ in range(args.runs)]
+    result = {
+        "first_update_s": round(statistics.median(startups), 3),
+        "own_import_ms": round(statistics.median(imports) * 1000, 1),
+        "import_budget_ms": args.import_budget
+    }
+    print(json.dumps(result, indent=2))
+
+    if result["own_import_ms"] > args.import_budget:
+        print(f"Import budget exceeded: {result['own_import_ms']}ms > {args.import_budget}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,61 @@
-import aiohttp
-from typing import Optional, List
+from typing import Optional, List, Callable, Awaitable, Tuple, Iterable, Iterator
 import os
-from datetime import datetime
+import json
+import logging
+import asyncio
+import random
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
+from bot.compaction import compact_tasks
+from bot.database import get_cached_report, save_cached_report
+from bot.http_session import get_session
+from bot.metrics import registry, span
+from bot.todoist_client import TaskBatch, local_now
+
+logger = logging.getLogger(__name__)
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent"
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+GEMINI_URL = f"{GEMINI_API_BASE}/v1beta/models/gemini-2.5-flash-lite:generateContent"
+GEMINI_STREAM_URL = f"{GEMINI_API_BASE}/v1beta/models/gemini-2.5-flash-lite:streamGenerateContent"
 
 EXCLUDE_PROJECTS = os.getenv("EXCLUDE_PROJECTS", "Inbox,Список желаний").split(",")
+EXCLUDED_PROJECT_NAMES = frozenset(p.strip().lower() for p in EXCLUDE_PROJECTS)
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "500"))
+REPORT_CACHE_PERSIST = os.getenv("REPORT_CACHE_PERSIST", "").lower() in ("1", "true", "yes")
+
+# С какого числа задач месячный отчёт собирается map-reduce по проектам
+MAP_REDUCE_MIN_TASKS = int(os.getenv("MAP_REDUCE_MIN_TASKS", "80"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+
+# Не больше стольких запросов к Gemini одновременно на процесс — по всем отчётам и map-шагам
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# Повторы при 429/503 от Gemini: Retry-After, если он есть, иначе экспонента с джиттером
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_DELAY = 1.0
+GEMINI_RETRY_MAX_DELAY = 30.0
+GEMINI_RETRY_STATUSES = (429, 503)
+
+
+@lru_cache(maxsize=4096)
+def is_work_project(project_name: str) -> bool:
+    """Рабочий ли проект: личные из EXCLUDE_PROJECTS в отчёты и статистику не попадают"""
+    return project_name.lower() not in EXCLUDED_PROJECT_NAMES
 
 
-def filter_work_tasks(tasks: list) -> list:
-    """Фильтрует задачи, исключая личные проекты"""
-    exclude = [p.strip().lower() for p in EXCLUDE_PROJECTS]
-    return [t for t in tasks if t.project_name.lower() not in exclude]
+def filter_work_tasks(tasks: Iterable) -> Iterator:
+    """Генератор задач без личных проектов; решение по проекту считается один раз на имя"""
+    return (t for t in tasks if is_work_project(t.project_name))
 
 
-def get_report_header(report_type: str) -> str:
-    """Генерирует заголовок отчёта с правильной датой"""
-    now = datetime.now()
+def get_report_header(report_type: str, utc_offset: Optional[int] = None) -> str:
+    """Генерирует заголовок отчёта с правильной датой (по времени юзера, если задан utc_offset)"""
+    now = local_now(utc_offset)
     
     if report_type == "daily":
         return f"Привет, отчет {now.day}.{now.month}\n\n"
@@ -47,10 +84,17 @@ DEFAULT_DAILY_PROMPT = """Сформируй дневной отчёт на ос
 Если в названии проекта есть ссылка в скобках, например: "719. MirrorBeam (https://link.com)"
 То сделай название кликабельным в HTML формате: <a href="https://link.com">719. MirrorBeam</a>
 
+Формат входа: задачи сгруппированы под строкой "Проект: название", по одной задаче на строку.
+"(xN)" в конце задачи значит, что такая задача выполнена N раз (одинаковые задачи схлопнуты).
+Строка "- … и ещё N" значит, что у проекта есть ещё N задач, которые не поместились.
+
 Пример входа:
-- Добил UI (проект: 719. MirrorBeam (https://link.com))
-- Отправил на онборды (проект: 719. MirrorBeam (https://link.com))
-- Проверил баги (проект: 680. GroupFusion)
+Проект: 719. MirrorBeam (https://link.com)
+- Добил UI
+- Отправил на онборды (x2)
+
+Проект: 680. GroupFusion
+- Проверил баги
 
 Пример выхода:
 <a href="https://link.com">719. MirrorBeam</a> (6 ч): Добил UI, отправил на онборды, протестировал на телевизоре
@@ -84,10 +128,18 @@ DEFAULT_MONTHLY_PROMPT = """Проанализируй список задач 
 Если в названии проекта есть ссылка в скобках, сделай название кликабельным:
 <a href="https://link.com">719. MirrorBeam</a>
 
+Формат входа: задачи сгруппированы под строкой "Проект: название", по одной задаче на строку.
+"(xN)" в конце задачи значит, что такая задача выполнена N раз (одинаковые задачи схлопнуты).
+Строка "- … и ещё N" значит, что у проекта есть ещё N задач, которые не поместились.
+У большого месяца вместо задач проекта может быть одна строка с готовым резюме.
+
 Пример входа:
-- Добил UI (проект: 719. MirrorBeam (https://link.com))
-- Хромакаст фичи (проект: 719. MirrorBeam (https://link.com))
-- Сделал функционал X (проект: 680. GroupFusion)
+Проект: 719. MirrorBeam (https://link.com)
+- Добил UI
+- Хромакаст фичи (x3)
+
+Проект: 680. GroupFusion
+- Сделал функционал X
 
 Пример ПРАВИЛЬНОГО выхода (стадия НЕ указана, т.к. не ясна из задач):
 <a href="https://link.com">719. MirrorBeam</a> - Добил UI, сделал хромакаст фичи
@@ -106,6 +158,29 @@ DEFAULT_MONTHLY_PROMPT = """Проанализируй список задач 
 {tasks}"""
 
 
+DEFAULT_PROJECT_SUMMARY_PROMPT = """Сделай краткое резюме (1-2 предложения) того, что было сделано в проекте за месяц, по списку задач.
+
+Правила:
+- НЕ пиши название проекта и заголовки - только само резюме
+- Стадию проекта пиши ТОЛЬКО если она ЯВНО видна из задач ("релиз", "отправил в стор", "тесты")
+- НЕ ВЫДУМЫВАЙ информацию которой нет в задачах
+- НЕ используй markdown и HTML
+- "(xN)" после задачи значит, что она выполнена N раз
+
+Задачи:
+{tasks}"""
+
+
+@lru_cache(maxsize=32)
+def parse_prompt(template: str) -> Tuple[str, ...]:
+    """Куски шаблона вокруг {tasks}; шаблон разбирается один раз, дальше — склейка"""
+    return tuple(template.split("{tasks}"))
+
+
+def render_prompt(template: str, tasks_text: str) -> str:
+    return tasks_text.join(parse_prompt(template))
+
+
 def get_daily_prompt() -> str:
     return os.getenv("DAILY_REPORT_PROMPT", DEFAULT_DAILY_PROMPT)
 
@@ -114,52 +189,279 @@ def get_monthly_prompt() -> str:
     return os.getenv("MONTHLY_REPORT_PROMPT", DEFAULT_MONTHLY_PROMPT)
 
 
-async def generate_report(tasks_text: str, report_type: str = "daily") -> Optional[str]:
-    if not GEMINI_API_KEY:
-        return None
-    
-    if report_type == "daily":
-        prompt_template = get_daily_prompt()
-    else:
-        prompt_template = get_monthly_prompt()
-    
-    prompt = prompt_template.replace("{tasks}", tasks_text)
-    
-    payload = {
+class ReportCache:
+    """LRU-кэш готовых отчётов по хэшу (тип отчёта, шаблон промпта, задачи).
+
+    Хранит текст без заголовка — заголовок с датой добавляется при выдаче.
+    При REPORT_CACHE_PERSIST дублирует записи в SQLite, чтобы пережить рестарт.
+    """
+
+    def __init__(self, max_size: int = REPORT_CACHE_SIZE, persist: bool = REPORT_CACHE_PERSIST):
+        self.max_size = max_size
+        self.persist = persist
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def make_key(tasks_text: str, prompt_template: str, report_type: str) -> str:
+        # Порядок строк не трогаем: задача относится к проекту по заголовку «Проект: X» над ней
+        lines = [" ".join(line.split()) for line in tasks_text.splitlines() if line.strip()]
+        digest = hashlib.sha256()
+        for part in (report_type, prompt_template, *lines):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        text = self._entries.get(key)
+        if text is None and self.persist:
+            text = await get_cached_report(key)
+            if text is not None:
+                self._remember(key, text)
+        if text is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return text
+
+    async def put(self, key: str, text: str):
+        self._remember(key, text)
+        if self.persist:
+            await save_cached_report(key, text)
+
+    def _remember(self, key: str, text: str):
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+report_cache = ReportCache()
+registry.add_gauge("bot_report_cache_hits_total", lambda: report_cache.hits, "counter")
+registry.add_gauge("bot_report_cache_misses_total", lambda: report_cache.misses, "counter")
+
+
+def _build_payload(prompt: str, max_tokens: int = 1024) -> dict:
+    return {
         "contents": [{
             "parts": [{"text": prompt}]
         }],
         "generationConfig": {
             "temperature": 0.7,
-            "maxOutputTokens": 1024
+            "maxOutputTokens": max_tokens
         }
     }
+
+
+def _clean_text(text: str) -> str:
+    return text.replace("**", "").replace("`", "")
+
+
+def _chunk_text(data: dict) -> str:
+    candidates = data.get("candidates", [])
+    if candidates:
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+    return ""
+
+
+def _retry_delay(retry_after: Optional[str], attempt: int) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), GEMINI_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    backoff = min(GEMINI_RETRY_BASE_DELAY * 2 ** attempt, GEMINI_RETRY_MAX_DELAY)
+    return random.uniform(backoff / 2, backoff)
+
+
+_gemini_slots = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+@asynccontextmanager
+async def _gemini_post(url: str, payload: dict):
+    """POST в Gemini с повторами на 429/503; отдаёт первый ответ, который не надо повторять.
+
+    Слот GEMINI_MAX_CONCURRENCY держится, пока читается ответ (в том числе стрим),
+    и отпускается на время паузы перед повтором. Стадия gemini — только сам
+    запрос с чтением ответа, без ожидания слота и очереди отчётов.
+    """
+    attempt = 0
+    while True:
+        async with _gemini_slots:
+            with span("gemini"):
+                async with get_session().post(
+                    url,
+                    json=payload,
+                    headers={"Content-Type": "application/json"}
+                ) as resp:
+                    if resp.status not in GEMINI_RETRY_STATUSES or attempt >= GEMINI_MAX_RETRIES:
+                        yield resp
+                        return
+                    delay = _retry_delay(resp.headers.get("Retry-After"), attempt)
+                    registry.inc("bot_upstream_errors_total", upstream="gemini", status=str(resp.status))
+        logger.warning("Gemini API %s, retry %d in %.1fs", resp.status, attempt + 1, delay)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _call_gemini(prompt: str, max_tokens: int = 1024) -> Optional[str]:
+    payload = _build_payload(prompt, max_tokens)
+    
+    try:
+        async with _gemini_post(f"{GEMINI_URL}?key={GEMINI_API_KEY}", payload) as resp:
+            if resp.status != 200:
+                registry.inc("bot_upstream_errors_total", upstream="gemini", status=str(resp.status))
+                error = await resp.text()
+                logger.error("Gemini API error %s: %s", resp.status, error)
+                return None
+            
+            data = await resp.json()
+            
+            candidates = data.get("candidates", [])
+            if candidates:
+                content = candidates[0].get("content", {})
+                parts = content.get("parts", [])
+                if parts:
+                    text = parts[0].get("text", "")
+                    return _clean_text(text)
+            
+            return None
+    except Exception as e:
+        registry.inc("bot_upstream_errors_total", upstream="gemini", status="exception")
+        logger.error("Gemini API exception: %s", e)
+        return None
+
+
+async def _stream_gemini(prompt: str, on_progress: Callable[[str], Awaitable[None]]) -> Optional[str]:
+    """streamGenerateContent в режиме SSE: on_progress получает накопленный текст после каждого чанка"""
+    text = ""
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{GEMINI_URL}?key={GEMINI_API_KEY}",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            ) as resp:
-                if resp.status != 200:
-                    error = await resp.text()
-                    print(f"Gemini API error: {error}")
-                    return None
-                
-                data = await resp.json()
-                
-                candidates = data.get("candidates", [])
-                if candidates:
-                    content = candidates[0].get("content", {})
-                    parts = content.get("parts", [])
-                    if parts:
-                        text = parts[0].get("text", "")
-                        text = text.replace("**", "").replace("`", "")
-                        header = get_report_header(report_type)
-                        return header + text
-                
+        async with _gemini_post(
+            f"{GEMINI_STREAM_URL}?alt=sse&key={GEMINI_API_KEY}",
+            _build_payload(prompt)
+        ) as resp:
+            if resp.status != 200:
+                registry.inc("bot_upstream_errors_total", upstream="gemini", status=str(resp.status))
+                error = await resp.text()
+                logger.error("Gemini API error %s: %s", resp.status, error)
                 return None
+            
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                chunk = _chunk_text(json.loads(line[5:]))
+                if chunk:
+                    text += chunk
+                    await on_progress(_clean_text(text))
     except Exception as e:
-        print(f"Gemini API exception: {e}")
+        registry.inc("bot_upstream_errors_total", upstream="gemini", status="exception")
+        logger.error("Gemini API exception: %s", e)
         return None
+    
+    return _clean_text(text) if text else None
+
+
+async def _complete(tasks_text: str, prompt_template: str, cache_type: str, use_cache: bool = True,
+                    on_progress: Optional[Callable[[str], Awaitable[None]]] = None,
+                    max_tokens: int = 1024) -> Optional[str]:
+    key = ReportCache.make_key(tasks_text, prompt_template, cache_type)
+    text = await report_cache.get(key) if use_cache else None
+    
+    if text is None:
+        prompt = render_prompt(prompt_template, tasks_text)
+        if on_progress:
+            text = await _stream_gemini(prompt, on_progress)
+        else:
+            text = await _call_gemini(prompt, max_tokens)
+        if text is None:
+            return None
+        await report_cache.put(key, text)
+    
+    return text
+
+
+async def generate_report(tasks_text: str, report_type: str = "daily", use_cache: bool = True,
+                          on_progress: Optional[Callable[[str], Awaitable[None]]] = None,
+                          utc_offset: Optional[int] = None) -> Optional[str]:
+    """Генерирует отчёт через Gemini.
+
+    use_cache=False — принудительно новая генерация. Если передан on_progress,
+    ответ стримится и on_progress получает текст с заголовком по мере генерации.
+    """
+    if not GEMINI_API_KEY:
+        return None
+    
+    if report_type == "daily":
+        prompt_template = get_daily_prompt()
+    else:
+        prompt_template = get_monthly_prompt()
+    
+    header = get_report_header(report_type, utc_offset)
+    
+    forward = None
+    if on_progress:
+        async def forward(partial: str):
+            await on_progress(header + partial)
+    
+    text = await _complete(tasks_text, prompt_template, report_type, use_cache, forward)
+    if text is None:
+        return None
+    
+    return header + text
+
+
+def uses_map_reduce(tasks: TaskBatch) -> bool:
+    return len(tasks) >= MAP_REDUCE_MIN_TASKS
+
+
+async def generate_monthly_report(tasks: TaskBatch, use_cache: bool = True,
+                                  on_progress: Optional[Callable[[str], Awaitable[None]]] = None,
+                                  tasks_text: Optional[str] = None,
+                                  utc_offset: Optional[int] = None) -> Optional[str]:
+    """Месячный отчёт; для больших месяцев — map-reduce по проектам.
+
+    Map: задачи каждого проекта параллельно (не больше MAP_REDUCE_CONCURRENCY
+    запросов) сжимаются в короткое резюме, резюме кэшируются по отдельности.
+    Reduce: из резюме обычным месячным промптом собирается итоговый отчёт.
+    tasks_text — уже сжатый список задач, если вызывающий его посчитал;
+    utc_offset — смещение юзера для даты в заголовке.
+    """
+    if not uses_map_reduce(tasks):
+        if tasks_text is None:
+            tasks_text = compact_tasks(tasks).text
+        return await generate_report(tasks_text, "monthly", use_cache, on_progress, utc_offset)
+    
+    if not GEMINI_API_KEY:
+        return None
+    
+    projects: dict = {}
+    for task in tasks:
+        projects.setdefault(task.project_name, TaskBatch()).append(task)
+    
+    compacted = {name: compact_tasks(items).text for name, items in projects.items()}
+    semaphore = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+    
+    async def summarize(project_text: str) -> Optional[str]:
+        async with semaphore:
+            return await _complete(
+                project_text, DEFAULT_PROJECT_SUMMARY_PROMPT, "project",
+                use_cache, max_tokens=256
+            )
+    
+    summaries = await asyncio.gather(*[summarize(text) for text in compacted.values()])
+    
+    # Reduce получает тот же формат, что и обычный месячный промпт: «Проект: X» и строки «- ...»
+    blocks = []
+    for (project_name, project_text), summary in zip(compacted.items(), summaries):
+        if summary:
+            blocks.append(f"Проект: {project_name}\n- {' '.join(summary.split())}")
+        else:
+            # Резюме не получилось — отдаём в reduce сами задачи проекта
+            blocks.append(project_text)
+    
+    return await generate_report("\n\n".join(blocks), "monthly", use_cache, on_progress, utc_offset)
@@ -0,0 +1,131 @@
+import os
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import List, Dict, Iterable
+
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+
+# Грубая оценка без токенизатора: кириллица у Gemini в среднем ~3 символа на токен
+CHARS_PER_TOKEN = 3
+NEAR_DUPLICATE_RATIO = 0.9
+# Почти дубль ищется только среди стольких последних групп с тем же ключом корзины
+NEAR_DUPLICATE_WINDOW = 16
+# Ключ корзины: числа строки и начало её первого слова
+NEAR_DUPLICATE_PREFIX = 3
+
+_NORMALIZE_RE = re.compile(r"[^\w]+")
+_NUMBERS_RE = re.compile(r"\d+")
+
+
+@dataclass
+class CompactedTasks:
+    text: str
+    tasks_count: int
+    lines_count: int
+    dropped_count: int
+    original_chars: int
+
+    @property
+    def ratio(self) -> float:
+        """Во сколько раз компактный текст короче построчного формата"""
+        return self.original_chars / max(len(self.text), 1)
+
+
+def _normalize(content: str) -> str:
+    return _NORMALIZE_RE.sub(" ", content.lower()).strip()
+
+
+def _dedupe(contents: List[str]) -> List[List]:
+    """Схлопывает точные и почти точные дубли: [[текст, количество], ...] в порядке появления.
+
+    Почти дублями считаются только строки с одинаковыми числами — «Сборка 1.2»
+    и «Сборка 1.3» остаются разными задачами. Кандидаты берутся из корзины
+    (числа + начало строки) и только последние NEAR_DUPLICATE_WINDOW, так что
+    на строку приходится ограниченное число сравнений.
+    """
+    groups: List[List] = []
+    by_key: Dict[str, List] = {}
+    buckets: Dict[tuple, List[tuple]] = {}
+    for content in contents:
+        key = _normalize(content)
+        group = by_key.get(key)
+        if group is None:
+            bucket = buckets.setdefault((tuple(_NUMBERS_RE.findall(key)), key[:NEAR_DUPLICATE_PREFIX]), [])
+            for candidate_key, candidate in reversed(bucket[-NEAR_DUPLICATE_WINDOW:]):
+                matcher = SequenceMatcher(None, key, candidate_key)
+                if matcher.real_quick_ratio() >= NEAR_DUPLICATE_RATIO and \
+                        matcher.quick_ratio() >= NEAR_DUPLICATE_RATIO and \
+                        matcher.ratio() >= NEAR_DUPLICATE_RATIO:
+                    group = candidate
+                    break
+            if group is None:
+                group = [content.strip(), 0]
+                groups.append(group)
+                bucket.append((key, group))
+            by_key[key] = group
+        group[1] += 1
+    return groups
+
+
+def compact_tasks(tasks: Iterable, token_budget: int = PROMPT_TOKEN_BUDGET) -> CompactedTasks:
+    """Собирает компактный список задач для промпта.
+
+    Задачи группируются под одним заголовком проекта, дубли схлопываются
+    со счётчиком. Если текст не влезает в token_budget, строки набираются
+    по кругу — по одной из каждого проекта, — чтобы ни один проект не пропал
+    целиком; остаток помечается строкой «… и ещё N».
+    """
+    projects: Dict[str, List[str]] = {}
+    original_chars = 0
+    for task in tasks:
+        projects.setdefault(task.project_name, []).append(task.content)
+        # Длина строки «- {content} (проект: {name})\n» из старого формата промпта
+        original_chars += len(task.content) + len(task.project_name) + 14
+
+    blocks = []
+    for project_name, contents in projects.items():
+        lines = [
+            f"- {content} (x{count})" if count > 1 else f"- {content}"
+            for content, count in _dedupe(contents)
+        ]
+        blocks.append((f"Проект: {project_name}", lines))
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    used = sum(len(header) + 2 for header, _ in blocks)
+    taken = [0] * len(blocks)
+    longest = max((len(lines) for _, lines in blocks), default=0)
+    full = False
+    for row in range(longest):
+        for i, (_, lines) in enumerate(blocks):
+            if row >= len(lines):
+                continue
+            cost = len(lines[row]) + 1
+            if used + cost > budget_chars:
+                full = True
+                break
+            used += cost
+            taken[i] += 1
+        if full:
+            break
+
+    parts = []
+    dropped = 0
+    lines_count = 0
+    for (header, lines), count in zip(blocks, taken):
+        parts.append(header)
+        parts.extend(lines[:count])
+        lines_count += count
+        if count < len(lines):
+            dropped += len(lines) - count
+            parts.append(f"- … и ещё {len(lines) - count}")
+        parts.append("")
+
+    return CompactedTasks(
+        text="\n".join(parts).strip(),
+        tasks_count=len(tasks),
+        lines_count=lines_count,
+        dropped_count=dropped,
+        original_chars=original_chars
+    )
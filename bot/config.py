@@ -5,4 +5,17 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-DATABASE_PATH = "users.db"
+DATABASE_PATH = os.getenv("DATABASE_PATH", "users.db")
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка для бенчмарков)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
+
+# Режим работы: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+
+# Отдельный порт для /metrics (в обоих режимах); не открывай его наружу
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
@@ -1,9 +1,61 @@
+import asyncio
+import time
 import aiosqlite
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, List, Tuple, Iterable
 from bot.config import DATABASE_PATH
+from bot.metrics import registry, span
+
+# Одно долгоживущее соединение на процесс: sqlite3 кэширует подготовленные
+# выражения на соединении, так что повторные запросы не парсятся заново
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA busy_timeout = 5000",
+)
+
+TOKEN_CACHE_SIZE = 10000
+# Токен могут сменить из другого процесса — не держим его в кэше вечно
+TOKEN_CACHE_TTL = 60
+REPORT_CACHE_PRUNE_EVERY = 100
+
+_db: Optional[aiosqlite.Connection] = None
+_db_lock = asyncio.Lock()
+_write_lock = asyncio.Lock()
+_token_cache: "OrderedDict[int, Tuple[float, Optional[str]]]" = OrderedDict()
+_report_cache_writes = 0
+
+
+async def get_db() -> aiosqlite.Connection:
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                db = await aiosqlite.connect(DATABASE_PATH)
+                for pragma in PRAGMAS:
+                    await db.execute(pragma)
+                _db = db
+    return _db
+
+
+@asynccontextmanager
+async def transaction():
+    """Запись под общим локом: операции разных корутин не смешиваются в одном коммите"""
+    async with _write_lock:
+        db = await get_db()
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
 
 
 async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with transaction() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 telegram_id INTEGER PRIMARY KEY,
@@ -11,30 +63,240 @@ async def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        await db.commit()
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS completed_tasks (
+                telegram_id INTEGER NOT NULL,
+                item_id TEXT NOT NULL,
+                content TEXT NOT NULL,
+                project_id TEXT,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (telegram_id, item_id)
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_completed_tasks_user_time
+            ON completed_tasks (telegram_id, completed_at)
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS completed_sync (
+                telegram_id INTEGER PRIMARY KEY,
+                synced_from TEXT NOT NULL,
+                synced_until TEXT NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS report_cache (
+                cache_key TEXT PRIMARY KEY,
+                report TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                storage_key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS report_schedules (
+                telegram_id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                send_time TEXT NOT NULL,
+                utc_offset INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                claimed_until REAL,
+                claimed_by TEXT
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_report_schedules_next_run
+            ON report_schedules (next_run_at)
+        """)
+
+
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+    _token_cache.clear()
 
 
 async def get_user_token(telegram_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
+    cached = _token_cache.get(telegram_id)
+    if cached is not None and time.monotonic() - cached[0] < TOKEN_CACHE_TTL:
+        _token_cache.move_to_end(telegram_id)
+        registry.inc("bot_cache_requests_total", cache="token", result="hit")
+        return cached[1]
+
+    registry.inc("bot_cache_requests_total", cache="token", result="miss")
+    with span("db_get_user_token"):
+        db = await get_db()
+        async with db.execute(
             "SELECT todoist_token FROM users WHERE telegram_id = ?",
             (telegram_id,)
-        )
-        row = await cursor.fetchone()
-        return row[0] if row else None
+        ) as cursor:
+            row = await cursor.fetchone()
+    token = row[0] if row else None
+
+    _token_cache[telegram_id] = (time.monotonic(), token)
+    _token_cache.move_to_end(telegram_id)
+    while len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return token
 
 
 async def save_user_token(telegram_id: int, token: str):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with transaction() as db:
         await db.execute("""
-            INSERT INTO users (telegram_id, todoist_token) 
+            INSERT INTO users (telegram_id, todoist_token)
             VALUES (?, ?)
             ON CONFLICT(telegram_id) DO UPDATE SET todoist_token = ?
         """, (telegram_id, token, token))
-        await db.commit()
+        # Новый токен может быть от другого аккаунта — историю синхронизируем заново
+        await db.execute("DELETE FROM completed_tasks WHERE telegram_id = ?", (telegram_id,))
+        await db.execute("DELETE FROM completed_sync WHERE telegram_id = ?", (telegram_id,))
+    _token_cache.pop(telegram_id, None)
 
 
 async def delete_user(telegram_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with transaction() as db:
         await db.execute("DELETE FROM users WHERE telegram_id = ?", (telegram_id,))
-        await db.commit()
+        await db.execute("DELETE FROM completed_tasks WHERE telegram_id = ?", (telegram_id,))
+        await db.execute("DELETE FROM completed_sync WHERE telegram_id = ?", (telegram_id,))
+        await db.execute("DELETE FROM report_schedules WHERE telegram_id = ?", (telegram_id,))
+    _token_cache.pop(telegram_id, None)
+
+
+async def get_sync_state(telegram_id: int) -> Optional[Tuple[str, str]]:
+    """Возвращает (synced_from, synced_until) для локальной истории юзера"""
+    db = await get_db()
+    async with db.execute(
+        "SELECT synced_from, synced_until FROM completed_sync WHERE telegram_id = ?",
+        (telegram_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+async def save_completed_tasks(telegram_id: int, items: Iterable[Tuple[str, str, str, str]],
+                               synced_from: str, synced_until: str):
+    """Сохраняет (item_id, content, project_id, completed_at) и сдвигает курсор синка"""
+    async with transaction() as db:
+        await db.executemany("""
+            INSERT OR REPLACE INTO completed_tasks
+                (telegram_id, item_id, content, project_id, completed_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(telegram_id, *item) for item in items])
+        await db.execute("""
+            INSERT INTO completed_sync (telegram_id, synced_from, synced_until)
+            VALUES (?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET synced_from = ?, synced_until = ?
+        """, (telegram_id, synced_from, synced_until, synced_from, synced_until))
+
+
+async def get_completed_tasks(telegram_id: int, since: str,
+                              until: Optional[str] = None) -> List[Tuple[str, str, str]]:
+    """Возвращает (content, project_id, completed_at) из локальной истории"""
+    db = await get_db()
+    async with db.execute("""
+        SELECT content, project_id, completed_at FROM completed_tasks
+        WHERE telegram_id = ? AND completed_at >= ? AND completed_at < ?
+        ORDER BY completed_at
+    """, (telegram_id, since, until or "9999")) as cursor:
+        return await cursor.fetchall()
+
+
+async def get_cached_report(cache_key: str) -> Optional[str]:
+    db = await get_db()
+    async with db.execute(
+        "SELECT report FROM report_cache WHERE cache_key = ?",
+        (cache_key,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+async def save_cached_report(cache_key: str, report: str, keep_days: int = 30):
+    global _report_cache_writes
+    async with transaction() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO report_cache (cache_key, report) VALUES (?, ?)",
+            (cache_key, report)
+        )
+        _report_cache_writes += 1
+        if _report_cache_writes % REPORT_CACHE_PRUNE_EVERY == 1:
+            await db.execute(
+                "DELETE FROM report_cache WHERE created_at < datetime('now', ?)",
+                (f"-{keep_days} days",)
+            )
+
+
+async def save_schedule(telegram_id: int, chat_id: int, send_time: str, utc_offset: int, next_run_at: float):
+    async with transaction() as db:
+        await db.execute("""
+            INSERT INTO report_schedules (telegram_id, chat_id, send_time, utc_offset, next_run_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                chat_id = excluded.chat_id,
+                send_time = excluded.send_time,
+                utc_offset = excluded.utc_offset,
+                next_run_at = excluded.next_run_at,
+                claimed_until = NULL,
+                claimed_by = NULL
+        """, (telegram_id, chat_id, send_time, utc_offset, next_run_at))
+
+
+async def delete_schedule(telegram_id: int):
+    async with transaction() as db:
+        await db.execute("DELETE FROM report_schedules WHERE telegram_id = ?", (telegram_id,))
+
+
+async def get_schedule(telegram_id: int) -> Optional[Tuple[int, str, int, float]]:
+    """Возвращает (chat_id, send_time, utc_offset, next_run_at)"""
+    db = await get_db()
+    async with db.execute(
+        "SELECT chat_id, send_time, utc_offset, next_run_at FROM report_schedules WHERE telegram_id = ?",
+        (telegram_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return tuple(row) if row else None
+
+
+async def claim_due_schedules(now: float, lease: float, limit: int,
+                              claim_id: str) -> List[Tuple[int, int, str, int, float]]:
+    """Забирает подошедшие расписания под аренду до now + lease.
+
+    Возвращает (telegram_id, chat_id, send_time, utc_offset, next_run_at).
+    Захват — один UPDATE, поэтому два процесса не заберут одного юзера.
+    Если процесс упадёт посреди рассылки, аренда истечёт и юзеры
+    вернутся в очередь — в том числе к другому процессу.
+    """
+    async with transaction() as db:
+        await db.execute("""
+            UPDATE report_schedules SET claimed_until = ?, claimed_by = ?
+            WHERE telegram_id IN (
+                SELECT telegram_id FROM report_schedules
+                WHERE next_run_at <= ? AND (claimed_until IS NULL OR claimed_until < ?)
+                ORDER BY next_run_at
+                LIMIT ?
+            )
+        """, (now + lease, claim_id, now, now, limit))
+    db = await get_db()
+    async with db.execute("""
+        SELECT telegram_id, chat_id, send_time, utc_offset, next_run_at FROM report_schedules
+        WHERE claimed_by = ? AND claimed_until = ?
+        ORDER BY next_run_at
+    """, (claim_id, now + lease)) as cursor:
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+async def complete_schedule(telegram_id: int, next_run_at: float):
+    async with transaction() as db:
+        await db.execute(
+            "UPDATE report_schedules SET next_run_at = ?, claimed_until = NULL, claimed_by = NULL "
+            "WHERE telegram_id = ?",
+            (next_run_at, telegram_id)
+        )
@@ -0,0 +1,188 @@
+import asyncio
+import html
+import logging
+import os
+import re
+from typing import List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, Message
+
+from bot.metrics import span
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Если отчёт режется больше чем на столько сообщений, он уходит файлом; 0 — всегда сообщениями
+DELIVERY_MAX_PARTS = int(os.getenv("DELIVERY_MAX_PARTS", "4"))
+# Telegram просит не слать в один чат чаще раза в секунду
+DELIVERY_PART_INTERVAL = float(os.getenv("DELIVERY_PART_INTERVAL", "1.0"))
+DELIVERY_MAX_RETRIES = 3
+
+# Ссылка целиком — один неделимый кусок, остальные теги и слова — по отдельности;
+# одиночный "<" без ">" — тоже кусок, чтобы из текста не пропадало ни символа
+ATOM_RE = re.compile(r"<a\s[^>]*>.*?</a>|<[^<>]+>|[^<\s]+\s*|\s+|<", re.DOTALL | re.IGNORECASE)
+TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+HREF_RE = re.compile(r"""href\s*=\s*["']?([^"'\s>]*)""", re.IGNORECASE)
+
+Stack = Tuple[Tuple[str, str], ...]
+
+
+def _atoms(text: str, max_size: int) -> List[str]:
+    atoms = []
+    for atom in ATOM_RE.findall(text):
+        if len(atom) <= max_size:
+            atoms.append(atom)
+        elif atom.startswith("<a"):
+            opening = atom[:atom.index(">") + 1]
+            if len(opening) <= max_size:
+                # Ссылка длиннее полсообщения — режем её как обычную разметку
+                atoms.append(opening)
+                atoms.extend(_atoms(atom[len(opening):-4], max_size))
+                atoms.append("</a>")
+            else:
+                # Сам тег не влезает в часть — оставляем текст ссылки и адрес после него
+                href = HREF_RE.search(opening)
+                text = atom[len(opening):-4]
+                atoms.extend(_atoms(f"{text} ({href.group(1)})" if href else text, max_size))
+        else:
+            while atom:
+                cut = max_size
+                entity = atom.rfind("&", 0, cut)
+                if entity != -1 and ";" not in atom[entity:cut]:
+                    cut = entity or cut
+                atoms.append(atom[:cut])
+                atom = atom[cut:]
+    return atoms
+
+
+def _apply(stack: Stack, atom: str) -> Stack:
+    """Стек открытых тегов после atom"""
+    match = TAG_RE.fullmatch(atom)
+    if not match:
+        return stack
+    closing, name = match.group(1), match.group(2).lower()
+    if not closing:
+        return stack + ((name, atom),)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] == name:
+            return stack[:i] + stack[i + 1:]
+    return stack
+
+
+def _closers(stack: Stack) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def split_html(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Режет HTML-текст на части не длиннее limit.
+
+    Резать стараемся по концам строк; ссылки <a href> не разрываются,
+    а теги, открытые на границе, закрываются в конце части и заново
+    открываются в начале следующей — каждая часть остаётся валидной.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    atoms = _atoms(text, limit // 2)
+    parts = []
+    stack: Stack = ()
+    i = 0
+    while i < len(atoms):
+        while i < len(atoms) and atoms[i].isspace():
+            i += 1
+        if i == len(atoms):
+            break
+
+        body = ["".join(tag for _, tag in stack)]
+        size = len(body[0])
+        part_stack = stack
+        line_break = None
+        j = i
+        while j < len(atoms):
+            next_stack = _apply(part_stack, atoms[j])
+            if size + len(atoms[j]) + len(_closers(next_stack)) > limit and j > i:
+                break
+            body.append(atoms[j])
+            size += len(atoms[j])
+            part_stack = next_stack
+            j += 1
+            if atoms[j - 1].endswith("\n"):
+                line_break = (j, part_stack, len(body))
+
+        if j < len(atoms) and line_break:
+            j, part_stack, kept = line_break
+            body = body[:kept]
+        parts.append("".join(body).rstrip() + _closers(part_stack))
+        stack = part_stack
+        i = j
+    return parts
+
+
+def strip_html(text: str) -> str:
+    return html.unescape(TAG_RE.sub("", text))
+
+
+async def _call(method, **kwargs):
+    """Вызов Bot API с ожиданием при flood-контроле"""
+    for attempt in range(DELIVERY_MAX_RETRIES + 1):
+        try:
+            return await method(**kwargs)
+        except TelegramRetryAfter as e:
+            if attempt == DELIVERY_MAX_RETRIES:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+async def _send_part(bot: Bot, chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup],
+                     edit: Optional[Message]):
+    kwargs = {"text": text, "parse_mode": "HTML", "reply_markup": reply_markup}
+    for _ in range(3):
+        try:
+            if edit is not None:
+                with span("telegram_edit_text"):
+                    return await _call(edit.edit_text, **kwargs)
+            with span("telegram_send_message"):
+                return await _call(bot.send_message, chat_id=chat_id, **kwargs)
+        except TelegramBadRequest as e:
+            if "parse entities" in str(e) and kwargs["parse_mode"]:
+                # Битую разметку от модели не теряем — отправляем текстом
+                logger.warning("Report part has invalid HTML, sending as plain text: %s", e)
+                kwargs = {**kwargs, "text": strip_html(text), "parse_mode": None}
+            elif edit is not None:
+                # Сообщение удалено или слишком старое — шлём новым
+                edit = None
+            else:
+                raise
+
+
+async def deliver(bot: Bot, chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                  edit: Optional[Message] = None, filename: str = "report.html"):
+    """Доставляет HTML-отчёт любой длины.
+
+    Короткий — одним сообщением (правкой edit, если оно передано). Длинный
+    режется split_html и уходит частями с паузой DELIVERY_PART_INTERVAL,
+    кнопки — под последней частью. Если частей больше DELIVERY_MAX_PARTS,
+    отчёт отправляется файлом filename с кнопками под ним.
+    """
+    parts = split_html(text)
+
+    if DELIVERY_MAX_PARTS and len(parts) > DELIVERY_MAX_PARTS:
+        document = (
+            "<!doctype html><meta charset=\"utf-8\">"
+            "<body style=\"white-space: pre-wrap; font-family: sans-serif\">" + text + "</body>"
+        ).encode("utf-8")
+        await _send_part(bot, chat_id, "📄 Отчёт получился длинным — отправляю файлом.", None, edit)
+        with span("telegram_send_document"):
+            await _call(
+                bot.send_document, chat_id=chat_id,
+                document=BufferedInputFile(document, filename), reply_markup=reply_markup
+            )
+        return
+
+    for i, part in enumerate(parts):
+        if i:
+            await asyncio.sleep(DELIVERY_PART_INTERVAL)
+        last = i == len(parts) - 1
+        await _send_part(bot, chat_id, part, reply_markup if last else None, edit if i == 0 else None)
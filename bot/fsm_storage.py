@@ -0,0 +1,112 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from bot.database import get_db, transaction
+
+# Состояние, которое не трогали дольше этого срока, считается брошенным
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(24 * 3600)))
+# Кэш в памяти живёт недолго: другой процесс может поменять состояние юзера.
+# За время одного апдейта aiogram читает состояние несколько раз — их и склеиваем
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "2"))
+FSM_CACHE_SIZE = 10000
+FSM_PURGE_EVERY = 100
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в users.db: переживает рестарт и общее для всех процессов бота"""
+
+    def __init__(self, state_ttl: int = FSM_STATE_TTL, cache_ttl: float = FSM_CACHE_TTL,
+                 cache_size: int = FSM_CACHE_SIZE):
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        self._writes = 0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _load(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            return cached[1], cached[2]
+
+        db = await get_db()
+        async with db.execute(
+            "SELECT state, data FROM fsm_states WHERE storage_key = ? AND updated_at >= ?",
+            (key, time.time() - self.state_ttl)
+        ) as cursor:
+            row = await cursor.fetchone()
+        state, data = (row[0], json.loads(row[1])) if row else (None, {})
+        self._remember(key, state, data)
+        return state, data
+
+    def _remember(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        self._cache[key] = (time.monotonic(), state, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _write(self, key: str, column: str, value: Optional[str]):
+        """Обновляет одну колонку, не затирая вторую, которую мог записать другой процесс"""
+        now = time.time()
+        async with transaction() as db:
+            await db.execute(f"""
+                INSERT INTO fsm_states (storage_key, state, data, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(storage_key) DO UPDATE SET
+                    state = CASE WHEN fsm_states.updated_at < ? THEN NULL ELSE fsm_states.state END,
+                    data = CASE WHEN fsm_states.updated_at < ? THEN '{{}}' ELSE fsm_states.data END,
+                    {column} = excluded.{column},
+                    updated_at = excluded.updated_at
+            """, (
+                key,
+                value if column == "state" else None,
+                value if column == "data" else "{}",
+                now,
+                now - self.state_ttl,
+                now - self.state_ttl
+            ))
+            await db.execute(
+                "DELETE FROM fsm_states WHERE storage_key = ? AND state IS NULL AND data = '{}'",
+                (key,)
+            )
+            self._writes += 1
+            if self._writes % FSM_PURGE_EVERY == 0:
+                await db.execute(
+                    "DELETE FROM fsm_states WHERE updated_at < ?",
+                    (now - self.state_ttl,)
+                )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        storage_key = self._key(key)
+        await self._write(storage_key, "state", state)
+        cached = self._cache.get(storage_key)
+        if cached is not None:
+            self._remember(storage_key, state, cached[2])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        await self._write(storage_key, "data", json.dumps(data, ensure_ascii=False))
+        cached = self._cache.get(storage_key)
+        if cached is not None:
+            self._remember(storage_key, cached[1], data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return data.copy()
+
+    async def close(self) -> None:
+        self._cache.clear()
@@ -1,7 +1,10 @@
 from aiogram import Router
 
-from bot.handlers import start, menu
+from bot.handlers import start, menu, schedule, stats, tasks
 
 router = Router()
 router.include_router(start.router)
 router.include_router(menu.router)
+router.include_router(schedule.router)
+router.include_router(stats.router)
+router.include_router(tasks.router)
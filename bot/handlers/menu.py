@@ -1,12 +1,33 @@
+import html
+import logging
+import time
+from datetime import date
+from typing import Optional, Tuple
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 
 from bot.handlers.base import get_client, get_client_for_callback
-from bot.ai_reports import generate_report, filter_work_tasks
+from bot.delivery import deliver
+from bot.metrics import span, report_trace
+from bot.report_queue import report_queue
+from bot.singleflight import SingleFlight
+from bot.todoist_client import TodoistClient, TaskBatch
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Не чаще одного редактирования сообщения за столько секунд при стриминге
+STREAM_EDIT_INTERVAL = 1.5
+# Промежуточный текст обрезаем с запасом до лимита Telegram в 4096 символов
+STREAM_PREVIEW_LIMIT = 4000
+
+# Отчёты в процессе генерации по (telegram_id, report_type, день)
+report_flights = SingleFlight()
+
 
 def main_menu_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -21,6 +42,56 @@ def back_keyboard():
     ])
 
 
+def throttled_editor(message: Message, interval: float = STREAM_EDIT_INTERVAL):
+    """Редактирует сообщение не чаще раза в interval секунд, лишние правки пропускает.
+
+    Правки идут без parse_mode — незакрытый HTML посреди генерации
+    Telegram не примет. Финальную правку с HTML делает вызывающий.
+    """
+    last_edit = 0.0
+    last_text = ""
+
+    async def edit(text: str):
+        nonlocal last_edit, last_text
+        now = time.monotonic()
+        if now - last_edit < interval or text == last_text:
+            return
+        last_edit = now
+        last_text = text
+        try:
+            with span("telegram_edit_text"):
+                await message.edit_text(text)
+        except TelegramRetryAfter as e:
+            last_edit = now + e.retry_after
+        except TelegramBadRequest:
+            pass
+
+    return edit
+
+
+def stream_editor(message: Message):
+    """Колбэк для стриминга отчёта: частичный текст с курсором"""
+    edit = throttled_editor(message)
+
+    async def on_progress(text: str):
+        await edit(text[:STREAM_PREVIEW_LIMIT] + " ▌")
+
+    return on_progress
+
+
+def queue_editor(message: Message):
+    """Колбэк очереди генерации: показывает позицию юзера"""
+    edit = throttled_editor(message)
+
+    async def on_position(position: int):
+        await edit(
+            f"⏳ Сейчас много запросов, ты {position}-й в очереди.\n"
+            f"Отчёт начнёт генерироваться, как только освободится место."
+        )
+
+    return on_position
+
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     client = await get_client(message)
@@ -44,25 +115,103 @@ async def cb_main_menu(callback: CallbackQuery):
 
 @router.callback_query(F.data.startswith("report:"))
 async def cb_generate_report(callback: CallbackQuery):
-    report_type = callback.data.split(":")[1]
+    parts = callback.data.split(":")
+    report_type = parts[1]
+    # "report:<type>:fresh" — явная перегенерация мимо кэша отчётов
+    fresh = len(parts) > 2 and parts[2] == "fresh"
+    
+    key = (callback.from_user.id, report_type, date.today().isoformat())
+    if report_flights.in_flight(key):
+        # Повторное нажатие, пока первый отчёт ещё готовится
+        await callback.answer("⏳ Отчёт уже готовится...")
+        return
+    
+    await report_flights.do(key, lambda: run_report(callback, report_type, fresh))
+
+
+async def load_report_tasks(client: TodoistClient, telegram_id: int, report_type: str,
+                            utc_offset: Optional[int] = None) -> TaskBatch:
+    # Отчётные модули грузятся при первом отчёте, а не на старте процесса
+    from bot.ai_reports import filter_work_tasks
+    from bot.history import get_today_completed, get_month_completed
+
+    if report_type == "daily":
+        tasks = await get_today_completed(client, telegram_id, utc_offset)
+    else:
+        tasks = await get_month_completed(client, telegram_id)
+    with span("filter_work_tasks"):
+        return TaskBatch.from_tasks(filter_work_tasks(tasks))
+
+
+async def build_report(telegram_id: int, report_type: str, tasks: TaskBatch, use_cache: bool = True,
+                       on_progress=None, on_position=None,
+                       utc_offset: Optional[int] = None) -> Tuple[Optional[str], str]:
+    """Сжимает задачи и генерирует отчёт через общую очередь; возвращает (отчёт, текст задач).
+
+    Большой месячный отчёт сжимает задачи по проектам сам (map-reduce), поэтому
+    общий сжатый список для него считается, только если отчёт не получился.
+    """
+    from bot.ai_reports import generate_report, generate_monthly_report, uses_map_reduce
+
+    map_reduce = report_type == "monthly" and uses_map_reduce(tasks)
+    tasks_text = None if map_reduce else _compact(tasks)
+    
+    async def generate():
+        with span("generate_report"):
+            if report_type == "daily":
+                return await generate_report(
+                    tasks_text, report_type,
+                    use_cache=use_cache,
+                    on_progress=on_progress,
+                    utc_offset=utc_offset
+                )
+            return await generate_monthly_report(
+                tasks,
+                use_cache=use_cache,
+                on_progress=on_progress,
+                tasks_text=tasks_text,
+                utc_offset=utc_offset
+            )
     
+    ai_report = await report_queue.run(telegram_id, generate, on_position=on_position)
+    if tasks_text is None:
+        tasks_text = "" if ai_report else _compact(tasks)
+    return ai_report, tasks_text
+
+
+def _compact(tasks: TaskBatch) -> str:
+    from bot.compaction import compact_tasks
+
+    with span("compact_tasks"):
+        compacted = compact_tasks(tasks)
+    logger.info(
+        "Prompt compaction: %d tasks -> %d lines (%d dropped), %d -> %d chars, ratio %.2f",
+        compacted.tasks_count, compacted.lines_count, compacted.dropped_count,
+        compacted.original_chars, len(compacted.text), compacted.ratio
+    )
+    return compacted.text
+
+
+async def run_report(callback: CallbackQuery, report_type: str, fresh: bool):
+    with report_trace(callback.from_user.id, report_type, "menu") as trace:
+        await _run_report(callback, report_type, fresh, trace)
+
+
+async def _run_report(callback: CallbackQuery, report_type: str, fresh: bool, trace: dict):
     client = await get_client_for_callback(callback)
     if not client:
+        trace["status"] = "no_token"
         return
     
     await callback.answer("⏳ Загружаю задачи...")
     await callback.message.edit_text("⏳ Загружаю задачи из Todoist...")
     
-    if report_type == "daily":
-        tasks = await client.get_today_completed()
-        period_text = "сегодня"
-    else:
-        tasks = await client.get_month_completed()
-        period_text = "этот месяц"
-    
-    tasks = filter_work_tasks(tasks)
+    tasks = await load_report_tasks(client, callback.from_user.id, report_type)
+    period_text = "сегодня" if report_type == "daily" else "этот месяц"
+    trace["tasks"] = len(tasks)
     
     if not tasks:
+        trace["status"] = "empty"
         await callback.message.edit_text(
             f"Нет выполненных задач за {period_text}.",
             reply_markup=back_keyboard()
@@ -71,25 +220,35 @@ async def cb_generate_report(callback: CallbackQuery):
     
     await callback.message.edit_text(f"🤖 Генерирую отчёт по {len(tasks)} задачам...")
     
-    tasks_text = "\n".join([f"- {t.content} (проект: {t.project_name})" for t in tasks])
-    ai_report = await generate_report(tasks_text, report_type)
+    ai_report, tasks_text = await build_report(
+        callback.from_user.id, report_type, tasks,
+        use_cache=not fresh,
+        on_progress=stream_editor(callback.message),
+        on_position=queue_editor(callback.message)
+    )
     
     if not ai_report:
-        await callback.message.edit_text(
+        trace["status"] = "failed"
+        await deliver(
+            callback.bot, callback.message.chat.id,
             f"❌ Не удалось сгенерировать отчёт.\n\n"
             f"Проверь GEMINI_API_KEY в Railway.\n\n"
-            f"Задачи ({len(tasks)}):\n" + tasks_text[:2000],
-            reply_markup=back_keyboard()
+            f"Задачи ({len(tasks)}):\n" + html.escape(tasks_text),
+            reply_markup=back_keyboard(),
+            edit=callback.message,
+            filename="tasks.html"
         )
         return
     
     back_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔄 Заново", callback_data=callback.data)],
+        [InlineKeyboardButton(text="🔄 Заново", callback_data=f"report:{report_type}")],
+        [InlineKeyboardButton(text="✨ Новая версия", callback_data=f"report:{report_type}:fresh")],
         [InlineKeyboardButton(text="🏠 Меню", callback_data="menu:main")]
     ])
     
-    await callback.message.edit_text(
-        ai_report,
+    await deliver(
+        callback.bot, callback.message.chat.id, ai_report,
         reply_markup=back_kb,
-        parse_mode="HTML"
+        edit=callback.message,
+        filename=f"report-{report_type}-{date.today().isoformat()}.html"
     )
@@ -0,0 +1,79 @@
+import os
+import re
+import time
+
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+
+from bot.handlers.base import get_client
+from bot.database import save_schedule, delete_schedule, get_schedule
+from bot.report_scheduler import next_run_at
+
+router = Router()
+
+# Часовой пояс по умолчанию, если юзер его не указал (по умолчанию МСК)
+DEFAULT_UTC_OFFSET = int(os.getenv("SCHEDULE_UTC_OFFSET", "3"))
+
+SCHEDULE_RE = re.compile(r"^(\d{1,2}):(\d{2})(?:\s+(?:UTC)?([+-]\d{1,2})(?::(\d{2}))?)?$", re.IGNORECASE)
+
+
+def format_offset(minutes: int) -> str:
+    sign = "+" if minutes >= 0 else "-"
+    hours, rest = divmod(abs(minutes), 60)
+    return f"UTC{sign}{hours}" + (f":{rest:02d}" if rest else "")
+
+
+USAGE = (
+    "⏰ Автоотчёты\n\n"
+    f"/schedule 18:00 - присылать отчёт каждый день в 18:00 ({format_offset(DEFAULT_UTC_OFFSET * 60)})\n"
+    "/schedule 18:00 +5 - то же, но по UTC+5\n"
+    "/schedule off - выключить\n\n"
+    "Первого числа вместе с дневным придёт и месячный отчёт."
+)
+
+
+@router.message(Command("schedule"))
+async def cmd_schedule(message: Message, command: CommandObject):
+    client = await get_client(message)
+    if not client:
+        return
+    
+    args = (command.args or "").strip()
+    
+    if not args:
+        schedule = await get_schedule(message.from_user.id)
+        if schedule:
+            _, send_time, utc_offset, _ = schedule
+            await message.answer(f"⏰ Отчёт приходит каждый день в {send_time} ({format_offset(utc_offset)}).\n\n" + USAGE)
+        else:
+            await message.answer(USAGE)
+        return
+    
+    if args.lower() == "off":
+        await delete_schedule(message.from_user.id)
+        await message.answer("🔕 Автоотчёты выключены.")
+        return
+    
+    match = SCHEDULE_RE.match(args)
+    if not match:
+        await message.answer("❌ Не понял время.\n\n" + USAGE)
+        return
+    
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if match.group(3):
+        sign = -1 if match.group(3).startswith("-") else 1
+        utc_offset = sign * (abs(int(match.group(3))) * 60 + int(match.group(4) or 0))
+    else:
+        utc_offset = DEFAULT_UTC_OFFSET * 60
+    
+    if hour > 23 or minute > 59 or not -12 * 60 <= utc_offset <= 14 * 60:
+        await message.answer("❌ Не понял время.\n\n" + USAGE)
+        return
+    
+    send_time = f"{hour:02d}:{minute:02d}"
+    await save_schedule(
+        message.from_user.id, message.chat.id, send_time, utc_offset,
+        next_run_at(send_time, utc_offset, time.time())
+    )
+    await message.answer(f"✅ Буду присылать отчёт каждый день в {send_time} ({format_offset(utc_offset)}).")
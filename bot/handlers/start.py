@@ -86,5 +86,8 @@ async def cmd_help(message: Message):
         "📖 Команды:\n\n"
         "/start - выбор проекта\n"
         "/setkey - сменить токен Todoist\n"
+        "/schedule - автоотчёты по расписанию\n"
+        "/stats - статистика за год: проекты, серии, часы\n"
+        "/import - добавить список задач, по одной на строку\n"
         "/help - эта справка"
     )
@@ -0,0 +1,37 @@
+import time
+
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command
+
+from bot.handlers.base import get_client
+from bot.handlers.schedule import DEFAULT_UTC_OFFSET
+from bot.database import get_schedule
+from bot.metrics import span
+
+router = Router()
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    client = await get_client(message)
+    if not client:
+        return
+
+    # numpy и статистика нужны только здесь — не тянем их на старте процесса
+    from bot.ai_reports import is_work_project
+    from bot.history import get_history_columns
+    from bot.stats import STATS_DAYS, TaskColumns, compute_stats, render_stats
+
+    status = await message.answer("⏳ Считаю статистику...")
+
+    schedule = await get_schedule(message.from_user.id)
+    utc_offset = schedule[2] if schedule else DEFAULT_UTC_OFFSET * 60
+
+    project_names, completed_at = await get_history_columns(client, message.from_user.id, STATS_DAYS)
+    with span("stats_aggregate"):
+        columns = TaskColumns.from_columns(project_names, completed_at, utc_offset, is_work_project)
+        today = int((time.time() + utc_offset * 60) // 86400)
+        text = render_stats(compute_stats(columns, today))
+
+    await status.edit_text(text)
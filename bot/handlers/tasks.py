@@ -0,0 +1,64 @@
+import html
+import re
+
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+
+from bot.handlers.base import get_client
+
+router = Router()
+
+# Больше за раз не принимаем: одно сообщение Telegram всё равно не вместит сильно больше
+IMPORT_MAX_TASKS = 300
+
+# Маркеры списков, которые часто вставляют вместе с задачами: "- ", "* ", "• ", "1. ", "[ ] "
+LIST_MARKER_RE = re.compile(r"^(?:[-*•]\s+|\d+[.)]\s+)?(?:\[[ xX]?\]\s+)?")
+
+USAGE = (
+    "📥 Импорт задач\n\n"
+    "Отправь список задач, по одной на строку:\n\n"
+    "/import\n"
+    "Купить молоко\n"
+    "Позвонить в банк\n"
+    "- Написать отчёт\n\n"
+    f"Задачи попадут во Входящие. За раз — до {IMPORT_MAX_TASKS}."
+)
+
+
+def parse_import(text: str) -> list:
+    tasks = []
+    for line in text.splitlines():
+        content = LIST_MARKER_RE.sub("", line.strip(), count=1).strip()
+        if content:
+            tasks.append(content)
+    return tasks
+
+
+@router.message(Command("import"))
+async def cmd_import(message: Message, command: CommandObject):
+    client = await get_client(message)
+    if not client:
+        return
+
+    tasks = parse_import(command.args or "")
+    if not tasks:
+        await message.answer(USAGE)
+        return
+    if len(tasks) > IMPORT_MAX_TASKS:
+        await message.answer(f"❌ Слишком много задач: {len(tasks)}. За раз — до {IMPORT_MAX_TASKS}.")
+        return
+
+    status = await message.answer(f"⏳ Добавляю задачи: {len(tasks)}...")
+    results = await client.add_tasks(tasks)
+
+    added = sum(result.ok for result in results)
+    failed = [result for result in results if not result.ok]
+    text = f"✅ Добавлено {added} из {len(results)}."
+    if failed:
+        lines = [f"• {html.escape(result.content[:80])} — {html.escape(result.error[:100])}" for result in failed[:20]]
+        if len(failed) > 20:
+            lines.append(f"… и ещё {len(failed) - 20}")
+        text += "\n\n❌ Не добавлены:\n" + "\n".join(lines)
+
+    await status.edit_text(text, parse_mode="HTML")
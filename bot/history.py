@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from bot.database import get_sync_state, save_completed_tasks, get_completed_tasks
+from bot.metrics import span
+from bot.todoist_client import TodoistClient, TodoistError, TaskBatch, local_now, parse_timestamp, to_utc
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Выполненные задачи иногда появляются в API с задержкой — перекрываем окно
+SYNC_OVERLAP = timedelta(minutes=10)
+
+# Ошибки Todoist и сети: при них отчёт строится по тому, что уже есть в истории
+TODOIST_ERRORS = (TodoistError, aiohttp.ClientError, asyncio.TimeoutError)
+
+
+def _to_row(item: dict) -> Tuple[str, str, str, str]:
+    completed_at = to_utc(parse_timestamp(item["completed_at"]))
+    item_id = item.get("id") or f"{item.get('task_id')}:{item['completed_at']}"
+    return (
+        str(item_id),
+        item["content"],
+        item.get("project_id", ""),
+        completed_at.strftime(TIMESTAMP_FORMAT)
+    )
+
+
+async def sync_completed(client: TodoistClient, telegram_id: int, since: datetime):
+    """Докачивает в локальную историю только то, что появилось после прошлого синка.
+
+    Курсор синка и границы хранятся в UTC, как и completed_at в истории.
+    """
+    now = datetime.now(timezone.utc)
+    since = to_utc(since)
+    since_str = since.strftime(TIMESTAMP_FORMAT)
+    state = await get_sync_state(telegram_id)
+
+    if state is None or since_str < state[0]:
+        fetch_from = since
+        synced_from = since_str
+    else:
+        # min — курсоры, записанные раньше в местном времени, могут оказаться в будущем
+        fetch_from = min(parse_timestamp(state[1]), now) - SYNC_OVERLAP
+        synced_from = state[0]
+
+    rows = [_to_row(item) async for item in client.iter_completed_items(fetch_from)]
+    await save_completed_tasks(telegram_id, rows, synced_from, now.strftime(TIMESTAMP_FORMAT))
+
+
+async def _load_completed(client: TodoistClient, telegram_id: int,
+                          since: datetime) -> Tuple[List[Tuple[str, str, str]], Dict[str, str]]:
+    """Синхронизирует историю и читает её с since: (строки из базы, карта проектов)"""
+    projects_task = asyncio.create_task(client.get_projects())
+    try:
+        try:
+            with span("todoist_completed_sync"):
+                await sync_completed(client, telegram_id, since)
+        except TODOIST_ERRORS as e:
+            # Отдаём то, что уже есть локально, вместо пустого отчёта
+            logger.warning("Completed tasks sync failed for %s: %s", telegram_id, e)
+
+        with span("db_completed_range"):
+            rows = await get_completed_tasks(telegram_id, to_utc(since).strftime(TIMESTAMP_FORMAT))
+        await projects_task
+        return rows, await client.get_projects(row[1] for row in rows)
+    finally:
+        # Если до projects_task не дошли — отменяем и забираем результат, иначе asyncio
+        # напишет в лог «Task exception was never retrieved»
+        if not projects_task.done():
+            projects_task.cancel()
+        await asyncio.gather(projects_task, return_exceptions=True)
+
+
+async def get_completed_since(client: TodoistClient, telegram_id: int, since: datetime) -> TaskBatch:
+    batch = TaskBatch()
+    try:
+        rows, projects = await _load_completed(client, telegram_id, since)
+    except TODOIST_ERRORS:
+        return batch
+
+    for content, project_id, completed_at in rows:
+        batch.add(content, projects.get(project_id, "Inbox"), completed_at)
+    return batch
+
+
+async def get_today_completed(client: TodoistClient, telegram_id: int,
+                              utc_offset: Optional[int] = None) -> TaskBatch:
+    """С полуночи по времени юзера (utc_offset в минутах), по умолчанию — по времени сервера"""
+    today = local_now(utc_offset).replace(hour=0, minute=0, second=0, microsecond=0)
+    return await get_completed_since(client, telegram_id, today)
+
+
+async def get_month_completed(client: TodoistClient, telegram_id: int) -> TaskBatch:
+    month_ago = datetime.now() - timedelta(days=30)
+    return await get_completed_since(client, telegram_id, month_ago)
+
+
+async def get_history_columns(client: TodoistClient, telegram_id: int,
+                              days: int) -> Tuple[List[str], List[str]]:
+    """История за days дней двумя колонками (project_name, completed_at в UTC) — без TaskInfo на задачу"""
+    since = datetime.now() - timedelta(days=days)
+    try:
+        rows, projects = await _load_completed(client, telegram_id, since)
+    except TODOIST_ERRORS:
+        return [], []
+    return [projects.get(row[1], "Inbox") for row in rows], [row[2] for row in rows]
@@ -0,0 +1,45 @@
+import aiohttp
+from typing import Optional
+
+
+TOTAL_CONNECTIONS = 100
+CONNECTIONS_PER_HOST = 20
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+REQUEST_TIMEOUT = 60
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=TOTAL_CONNECTIONS,
+        limit_per_host=CONNECTIONS_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    )
+
+
+async def init_http():
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Общая сессия на весь процесс: keep-alive и пул соединений к Todoist и Gemini"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+async def close_http():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -1,12 +1,19 @@
 import asyncio
+import contextlib
 import logging
+import sys
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from bot.config import BOT_TOKEN
-from bot.database import init_db
+from bot.config import BOT_TOKEN, BOT_MODE, TELEGRAM_API_BASE, WEBAPP_HOST, METRICS_PORT
+from bot.database import init_db, close_db
+from bot.fsm_storage import SQLiteStorage
+from bot.http_session import init_http, close_http
+from bot.metrics import start_metrics_server
 from bot.handlers import router
+from bot.report_scheduler import ReportScheduler
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,7 +22,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def main():
+def create_bot() -> Bot:
+    if TELEGRAM_API_BASE:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))
+        return Bot(token=BOT_TOKEN, session=session)
+    return Bot(token=BOT_TOKEN)
+
+
+async def main(mode: str = BOT_MODE):
     if not BOT_TOKEN:
         logger.error("BOT_TOKEN not set in .env file")
         return
@@ -23,13 +37,34 @@ async def main():
     await init_db()
     logger.info("Database initialized")
     
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    await init_http()
+    
+    bot = create_bot()
+    dp = Dispatcher(storage=SQLiteStorage())
     dp.include_router(router)
     
-    logger.info("Starting bot...")
-    await dp.start_polling(bot)
+    scheduler = asyncio.create_task(ReportScheduler(bot).run())
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(WEBAPP_HOST, METRICS_PORT)
+    
+    logger.info("Starting bot in %s mode...", mode)
+    try:
+        if mode == "webhook":
+            from bot.webhook import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        scheduler.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await scheduler
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await close_http()
+        await close_db()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(*sys.argv[1:2]))
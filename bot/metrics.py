@@ -0,0 +1,158 @@
+import json
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Счётчики и гистограммы в памяти процесса + вывод в формате Prometheus.
+
+    Запись — пара словарных операций, так что метрики можно держать
+    включёнными в проде. Значения, которые уже считаются в других местах
+    (кэши, очередь), подключаются через add_gauge и читаются при выводе.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def add_gauge(self, name: str, read: Callable[[], float], kind: str = "gauge"):
+        """Значение, которое читается при выводе; kind="counter" для растущих счётчиков"""
+        self.gauges[name] = (kind, read)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_labels(key)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(key + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(key)} {histogram.total:.6f}")
+                lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+        for name, (kind, read) in sorted(self.gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+registry = Registry()
+
+# Стадии текущего отчёта: span() дописывает сюда длительности для итоговой строки лога
+_report_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("report_stages", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Замеряет стадию: гистограмма bot_stage_seconds{stage=...} и вклад в лог текущего отчёта"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe("bot_stage_seconds", elapsed, stage=stage)
+        stages = _report_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def report_trace(telegram_id: int, report_type: str, source: str) -> Iterator[Dict[str, object]]:
+    """Собирает стадии одного отчёта и в конце пишет одну структурированную строку лога.
+
+    В отданный словарь можно дописать поля (число задач, результат).
+    """
+    stages: Dict[str, float] = {}
+    info: Dict[str, object] = {}
+    token = _report_stages.set(stages)
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield info
+        status = str(info.pop("status", "ok"))
+    finally:
+        _report_stages.reset(token)
+        total = time.perf_counter() - started
+        registry.observe("bot_report_seconds", total, report_type=report_type, source=source)
+        registry.inc("bot_reports_total", report_type=report_type, source=source, status=status)
+        logger.info("report %s", json.dumps({
+            "user": telegram_id,
+            "type": report_type,
+            "source": source,
+            "status": status,
+            "total_ms": round(total * 1000, 1),
+            "stages_ms": {stage: round(value * 1000, 1) for stage, value in stages.items()},
+            **info
+        }, ensure_ascii=False))
+
+
+async def handle_metrics(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> "web.AppRunner":
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,104 @@
+import asyncio
+import os
+from collections import deque
+
+from bot.metrics import registry
+from typing import Optional, Callable, Awaitable, Dict, Any, TypeVar
+
+T = TypeVar("T")
+
+# Сколько отчётов генерируется одновременно; отдельные запросы к Gemini ограничивает
+# GEMINI_MAX_CONCURRENCY в ai_reports (месячный map-reduce делает несколько запросов на отчёт)
+REPORT_MAX_CONCURRENCY = int(os.getenv("REPORT_MAX_CONCURRENCY", "8"))
+
+
+class ReportQueue:
+    """Допуск к генерации отчётов: не больше max_concurrent одновременно на процесс.
+
+    Остальные ждут в FIFO-очереди и получают свою позицию через on_position.
+    У одного юзера одновременно генерируется не больше одного отчёта —
+    следующий его запрос ждёт, не занимая место в общей очереди.
+    """
+
+    def __init__(self, max_concurrent: int = REPORT_MAX_CONCURRENCY):
+        self.max_concurrent = max_concurrent
+        self._active = 0
+        self._waiters: deque = deque()
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_refs: Dict[int, int] = {}
+        self._notifications: set = set()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def run(self, user_id: int, job: Callable[[], Awaitable[T]],
+                  on_position: Optional[Callable[[int], Awaitable[Any]]] = None) -> T:
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_refs[user_id] = self._user_refs.get(user_id, 0) + 1
+        try:
+            async with lock:
+                await self._acquire(on_position)
+                try:
+                    return await job()
+                finally:
+                    self._release()
+        finally:
+            self._user_refs[user_id] -= 1
+            if not self._user_refs[user_id]:
+                del self._user_refs[user_id]
+                del self._user_locks[user_id]
+
+    async def _acquire(self, on_position: Optional[Callable[[int], Awaitable[Any]]]):
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return
+
+        waiter = (asyncio.get_running_loop().create_future(), on_position)
+        self._waiters.append(waiter)
+        if on_position:
+            self._notify(on_position, len(self._waiters))
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            if waiter[0].done() and not waiter[0].cancelled():
+                # Место уже выдали, но задачу отменили — возвращаем его
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+                self._notify_positions()
+            raise
+
+    def _release(self):
+        self._active -= 1
+        while self._waiters and self._active < self.max_concurrent:
+            future, _ = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self._active += 1
+        self._notify_positions()
+
+    def _notify_positions(self):
+        for position, (_, on_position) in enumerate(self._waiters, start=1):
+            if on_position:
+                self._notify(on_position, position)
+
+    def _notify(self, on_position: Callable[[int], Awaitable[Any]], position: int):
+        async def notify():
+            try:
+                await on_position(position)
+            except Exception:
+                pass
+
+        task = asyncio.create_task(notify())
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+
+report_queue = ReportQueue()
+registry.add_gauge("bot_report_queue_active", lambda: report_queue.active)
+registry.add_gauge("bot_report_queue_waiting", lambda: report_queue.waiting)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+
+from bot.database import (
+    get_user_token, claim_due_schedules, complete_schedule, delete_schedule
+)
+from bot.delivery import deliver
+from bot.metrics import report_trace
+from bot.todoist_client import TodoistClient, local_now
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CONCURRENCY = int(os.getenv("SCHEDULE_CONCURRENCY", "10"))
+# Юзеры с одинаковым временем размазываются по этому окну, чтобы не бить Todoist и Gemini разом
+SCHEDULE_JITTER = int(os.getenv("SCHEDULE_JITTER", "600"))
+SCHEDULE_POLL_INTERVAL = 30
+SCHEDULE_BATCH_SIZE = 100
+# Сколько процесс держит захваченного юзера; после падения тот вернётся в очередь
+SCHEDULE_LEASE = 900
+# Отчёт, опоздавший больше чем на столько (бот лежал), не шлём — ждём следующего дня
+SCHEDULE_MAX_LATENESS = 3 * 3600
+
+
+def next_run_at(send_time: str, utc_offset: int, after: float) -> float:
+    """Ближайшее send_time по местному времени юзера позже after, плюс случайный сдвиг"""
+    hour, minute = map(int, send_time.split(":"))
+    local = datetime.fromtimestamp(after, timezone(timedelta(minutes=utc_offset)))
+    slot = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if slot.timestamp() <= after:
+        slot += timedelta(days=1)
+    return slot.timestamp() + random.uniform(0, SCHEDULE_JITTER)
+
+
+class ReportScheduler:
+    """Рассылка отчётов по расписанию.
+
+    Подошедшие расписания захватываются пачками из report_schedules и
+    обрабатываются параллельно, не больше SCHEDULE_CONCURRENCY за раз.
+    После отправки юзеру назначается следующий день; прогресс хранится
+    в базе, так что после рестарта рассылка продолжается с того же места.
+    """
+
+    def __init__(self, bot: Bot, concurrency: int = SCHEDULE_CONCURRENCY):
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception:
+                logger.exception("Scheduled reports batch failed")
+                processed = 0
+            if processed < SCHEDULE_BATCH_SIZE:
+                await asyncio.sleep(SCHEDULE_POLL_INTERVAL)
+
+    async def run_once(self) -> int:
+        now = time.time()
+        rows = await claim_due_schedules(now, SCHEDULE_LEASE, SCHEDULE_BATCH_SIZE, uuid.uuid4().hex)
+        await asyncio.gather(*[self._process(*row) for row in rows])
+        return len(rows)
+
+    async def _process(self, telegram_id: int, chat_id: int, send_time: str,
+                       utc_offset: int, scheduled_at: float):
+        async with self.semaphore:
+            try:
+                if time.time() - scheduled_at > SCHEDULE_MAX_LATENESS:
+                    logger.info("Skipping stale scheduled report for %s", telegram_id)
+                elif not await self._send(telegram_id, chat_id, utc_offset):
+                    return
+            except Exception:
+                logger.exception("Scheduled report for %s failed", telegram_id)
+            await complete_schedule(telegram_id, next_run_at(send_time, utc_offset, time.time()))
+
+    async def _send(self, telegram_id: int, chat_id: int, utc_offset: int) -> bool:
+        """Шлёт дневной отчёт, а первого числа ещё и месячный; False — расписание удалено"""
+        from bot.handlers.menu import load_report_tasks, build_report
+
+        token = await get_user_token(telegram_id)
+        if not token:
+            await delete_schedule(telegram_id)
+            return False
+
+        client = TodoistClient(token)
+        today = local_now(utc_offset).date()
+        report_types = ["daily", "monthly"] if today.day == 1 else ["daily"]
+
+        for report_type in report_types:
+            with report_trace(telegram_id, report_type, "schedule") as trace:
+                tasks = await load_report_tasks(client, telegram_id, report_type, utc_offset)
+                trace["tasks"] = len(tasks)
+                if not tasks:
+                    trace["status"] = "empty"
+                    continue
+                report, _ = await build_report(telegram_id, report_type, tasks, utc_offset=utc_offset)
+                if not report:
+                    trace["status"] = "failed"
+                    continue
+                await deliver(
+                    self.bot, chat_id, report,
+                    filename=f"report-{report_type}-{today.isoformat()}.html"
+                )
+        return True
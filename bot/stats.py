@@ -0,0 +1,129 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+STATS_DAYS = 365
+STATS_TOP_PROJECTS = 7
+# Спарклайн по проектам — по неделям за последние столько недель
+STATS_PROJECT_WEEKS = 12
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+URL_IN_NAME_RE = re.compile(r"\s*\(https?://[^)]*\)")
+
+
+@dataclass
+class TaskColumns:
+    """Выполненные задачи в колонках: код проекта и местное время в секундах эпохи"""
+    project_codes: np.ndarray
+    project_names: List[str]
+    local_seconds: np.ndarray
+
+    @classmethod
+    def from_columns(cls, project_names: Sequence[str], completed_at: Sequence[str], utc_offset: int,
+                     include: Callable[[str], bool] = lambda name: True) -> "TaskColumns":
+        """completed_at — строки ISO в UTC; utc_offset в минутах; include отбирает проекты"""
+        index: Dict[str, int] = {}
+        codes = np.fromiter((index.setdefault(name, len(index)) for name in project_names),
+                            dtype=np.int32, count=len(project_names))
+        names = list(index)
+        seconds = np.array(completed_at, dtype="datetime64[s]").astype(np.int64) + utc_offset * 60
+
+        keep = np.array([include(name) for name in names], dtype=bool)
+        if not keep.all():
+            # Перенумеровываем оставшиеся проекты подряд, чтобы bincount не тащил пустые
+            mask = keep[codes]
+            remap = np.cumsum(keep) - 1
+            codes, seconds = remap[codes[mask]].astype(np.int32), seconds[mask]
+            names = [name for name, kept in zip(names, keep) if kept]
+        return cls(codes, names, seconds)
+
+
+@dataclass
+class Stats:
+    days: int
+    total: int
+    active_days: int
+    per_day: np.ndarray
+    projects: List[Tuple[str, int, np.ndarray]]
+    hours: np.ndarray
+    weekdays: np.ndarray
+    current_streak: int
+    longest_streak: int
+
+
+def compute_stats(columns: TaskColumns, today: int, days: int = STATS_DAYS) -> Stats:
+    """Считает статистику за days дней до today включительно (today — номер местного дня от эпохи)"""
+    day = columns.local_seconds // 86400
+    offset = day - (today - days + 1)
+    mask = (offset >= 0) & (offset < days)
+    offset, codes, seconds = offset[mask], columns.project_codes[mask], columns.local_seconds[mask]
+
+    projects_count = len(columns.project_names)
+    matrix = np.bincount(codes * days + offset, minlength=projects_count * days).reshape(projects_count, days)
+    per_day = matrix.sum(axis=0)
+    per_project = matrix.sum(axis=1)
+
+    weeks = min(STATS_PROJECT_WEEKS, days // 7)
+    weekly = matrix[:, days - weeks * 7:].reshape(projects_count, weeks, 7).sum(axis=2)
+    top = np.argsort(-per_project, kind="stable")[:STATS_TOP_PROJECTS]
+    projects = [
+        (columns.project_names[code], int(per_project[code]), weekly[code])
+        for code in top if per_project[code]
+    ]
+
+    # Серии активных дней: границы отрезков из единиц через diff
+    active = np.concatenate(([0], (per_day > 0).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(active))
+    starts, ends = edges[::2], edges[1::2]
+    runs = ends - starts
+    longest = int(runs.max()) if runs.size else 0
+    # Серия не прерывается, пока сегодня ещё ничего не сделано
+    current = int(runs[-1]) if runs.size and ends[-1] >= days - 1 else 0
+
+    return Stats(
+        days=days,
+        total=int(per_day.sum()),
+        active_days=int((per_day > 0).sum()),
+        per_day=per_day,
+        projects=projects,
+        hours=np.bincount(seconds % 86400 // 3600, minlength=24),
+        weekdays=np.bincount((day[mask] + 3) % 7, minlength=7),
+        current_streak=current,
+        longest_streak=longest
+    )
+
+
+def sparkline(values: np.ndarray) -> str:
+    top = values.max() if values.size else 0
+    if not top:
+        return SPARK_CHARS[0] * len(values)
+    levels = np.ceil(values / top * (len(SPARK_CHARS) - 1)).astype(int)
+    return "".join(SPARK_CHARS[level] for level in levels)
+
+
+def render_stats(stats: Stats) -> str:
+    if not stats.total:
+        return "📈 За год нет выполненных задач в рабочих проектах."
+
+    lines = [
+        "📈 Статистика за год\n",
+        f"✅ Выполнено: {stats.total} в {stats.active_days} дн. "
+        f"(в среднем {stats.total / stats.active_days:.1f} в активный день)",
+        f"🔥 Серия: {stats.current_streak} дн., рекорд — {stats.longest_streak}",
+        f"\nПоследние 30 дней:\n{sparkline(stats.per_day[-30:])}",
+        f"\nПроекты (по неделям, {STATS_PROJECT_WEEKS} нед.):"
+    ]
+    for name, count, weekly in stats.projects:
+        lines.append(f"{sparkline(weekly)} {count} — {URL_IN_NAME_RE.sub('', name)}")
+
+    busiest = np.argsort(-stats.hours, kind="stable")[:3]
+    lines.append("\n⏰ Самые продуктивные часы: " + ", ".join(
+        f"{hour:02d}:00 ({stats.hours[hour]})" for hour in busiest if stats.hours[hour]
+    ))
+    lines.append("📅 По дням недели: " + " ".join(
+        f"{name} {count}" for name, count in zip(WEEKDAYS, stats.weekdays)
+    ))
+    return "\n".join(lines)
@@ -1,97 +1,409 @@
-from todoist_api_python.api import TodoistAPI
-from datetime import datetime, timedelta
+import asyncio
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterable, Iterator, Callable, Awaitable, Tuple, Union
+
 import aiohttp
 
+from bot.http_session import get_session
+from bot.metrics import registry, span
+
+
+TODOIST_API_BASE = os.getenv("TODOIST_API_BASE", "https://api.todoist.com")
+TODOIST_REST_URL = f"{TODOIST_API_BASE}/rest/v2"
+TODOIST_SYNC_URL = f"{TODOIST_API_BASE}/sync/v9"
+
+# completed/get_all отдаёт не больше 200 элементов за запрос
+COMPLETED_PAGE_SIZE = 200
+COMPLETED_PAGE_FANOUT = 4
+
+# Sync API принимает не больше 100 команд за запрос
+SYNC_COMMANDS_LIMIT = 100
+
+PROJECTS_CACHE_TTL = 300
+PROJECTS_CACHE_STALE_TTL = 3600
+PROJECTS_CACHE_SIZE = 1000
+
+
+class TodoistError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"Todoist API error {status}: {message}")
+        self.status = status
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Время из API ("...Z") или из локальной истории (UTC без зоны) в aware datetime"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def to_utc(value: datetime) -> datetime:
+    """Aware datetime в UTC; naive считается местным временем сервера"""
+    return value.astimezone(timezone.utc)
+
+
+def local_now(utc_offset: Optional[int] = None) -> datetime:
+    """Текущее время юзера со смещением utc_offset (минуты); без смещения — время сервера"""
+    if utc_offset is None:
+        return datetime.now()
+    return datetime.now(timezone(timedelta(minutes=utc_offset)))
+
 
-@dataclass
 class TaskInfo:
+    """Задача для отчёта.
+
+    Слоты вместо __dict__, имя проекта интернируется (у тысяч задач оно
+    одно и то же), а completed_at хранится строкой и разбирается в datetime
+    только при первом обращении.
+    """
+    __slots__ = ("content", "project_name", "due_date", "_completed_at")
+
+    def __init__(self, content: str, project_name: str,
+                 completed_at: Union[datetime, str, None] = None, due_date: Optional[str] = None):
+        self.content = content
+        self.project_name = sys.intern(project_name)
+        self.due_date = due_date
+        self._completed_at = completed_at
+
+    @property
+    def completed_at(self) -> Optional[datetime]:
+        value = self._completed_at
+        if isinstance(value, str):
+            value = self._completed_at = parse_timestamp(value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"TaskInfo(content={self.content!r}, project_name={self.project_name!r})"
+
+
+class TaskBatch:
+    """Пачка задач в колонках: тексты, интернированные имена проектов, сырые времена.
+
+    Держит три списка вместо объекта на задачу; при итерации отдаёт
+    TaskInfo по одной, так что целиком они в памяти не копятся.
+    """
+    __slots__ = ("contents", "project_names", "completed_at")
+
+    def __init__(self):
+        self.contents: List[str] = []
+        self.project_names: List[str] = []
+        self.completed_at: List[Optional[str]] = []
+
+    @classmethod
+    def from_tasks(cls, tasks: Iterable[TaskInfo]) -> "TaskBatch":
+        batch = cls()
+        for task in tasks:
+            batch.append(task)
+        return batch
+
+    def add(self, content: str, project_name: str, completed_at: Optional[str] = None):
+        self.contents.append(content)
+        self.project_names.append(sys.intern(project_name))
+        self.completed_at.append(completed_at)
+
+    def append(self, task: TaskInfo):
+        completed_at = task._completed_at
+        if isinstance(completed_at, datetime):
+            completed_at = completed_at.isoformat()
+        self.contents.append(task.content)
+        self.project_names.append(task.project_name)
+        self.completed_at.append(completed_at)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __iter__(self) -> Iterator[TaskInfo]:
+        for content, project_name, completed_at in zip(self.contents, self.project_names, self.completed_at):
+            yield TaskInfo(content, project_name, completed_at)
+
+
+@dataclass
+class AddResult:
+    """Итог добавления одной задачи из пачки: task_id при успехе, иначе error"""
     content: str
-    project_name: str
-    completed_at: Optional[datetime] = None
-    due_date: Optional[str] = None
+    task_id: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.task_id is not None
+
+
+class ProjectCache:
+    """LRU-кэш карт project_id -> name по токену, общий для всех TodoistClient.
+
+    Свежая запись (моложе ttl) отдаётся как есть; устаревшая, но моложе
+    stale_ttl, отдаётся сразу, а обновляется в фоне.
+    """
+
+    def __init__(self, ttl: float = PROJECTS_CACHE_TTL, stale_ttl: float = PROJECTS_CACHE_STALE_TTL,
+                 max_size: int = PROJECTS_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        # id, которых нет даже в свежей карте (удалённые проекты), — чтобы не перезапрашивать их каждый раз
+        self._missing: Dict[str, set] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def get(self, token: str, fetch: Callable[[], Awaitable[Dict[str, str]]]) -> Dict[str, str]:
+        entry = self._entries.get(token)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.stale_ttl:
+                self.hits += 1
+                self._entries.move_to_end(token)
+                if age >= self.ttl:
+                    self._refresh_in_background(token, fetch)
+                return entry[1]
+
+        self.misses += 1
+        projects = await fetch()
+        self.put(token, projects)
+        return projects
+
+    def put(self, token: str, projects: Dict[str, str]):
+        self._entries[token] = (time.monotonic(), projects)
+        self._entries.move_to_end(token)
+        self._missing.pop(token, None)
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            self._missing.pop(evicted, None)
+
+    def invalidate(self, token: str):
+        self._entries.pop(token, None)
+        self._missing.pop(token, None)
+
+    def is_missing(self, token: str, project_ids: set) -> bool:
+        return project_ids <= self._missing.get(token, set())
+
+    def mark_missing(self, token: str, project_ids: set):
+        if token in self._entries:
+            self._missing.setdefault(token, set()).update(project_ids)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _refresh_in_background(self, token: str, fetch: Callable[[], Awaitable[Dict[str, str]]]):
+        if token in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                self.put(token, await fetch())
+            except Exception:
+                pass
+            finally:
+                self._refreshing.pop(token, None)
+
+        self._refreshing[token] = asyncio.create_task(refresh())
+
+
+project_cache = ProjectCache()
+registry.add_gauge("bot_project_cache_hits_total", lambda: project_cache.hits, "counter")
+registry.add_gauge("bot_project_cache_misses_total", lambda: project_cache.misses, "counter")
 
 
 class TodoistClient:
     def __init__(self, token: str):
         self.token = token
-        self.api = TodoistAPI(token)
-    
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+
+    async def _request(self, method: str, url: str, stage: str = "todoist", **kwargs) -> Any:
+        with span(stage):
+            try:
+                async with get_session().request(method, url, headers=self.headers, **kwargs) as resp:
+                    if resp.status >= 400:
+                        registry.inc("bot_upstream_errors_total", upstream="todoist", status=str(resp.status))
+                        raise TodoistError(resp.status, await resp.text())
+                    if resp.status == 204:
+                        return None
+                    return await resp.json()
+            except aiohttp.ClientError:
+                registry.inc("bot_upstream_errors_total", upstream="todoist", status="network")
+                raise
+
     async def verify_token(self) -> bool:
         try:
-            self.api.get_projects()
+            project_cache.put(self.token, await self._fetch_projects())
             return True
         except Exception:
             return False
-    
-    async def get_projects(self) -> Dict[str, str]:
-        projects = self.api.get_projects()
-        return {p.id: p.name for p in projects}
-    
+
+    async def _fetch_projects(self) -> Dict[str, str]:
+        projects = await self._request("GET", f"{TODOIST_REST_URL}/projects", stage="todoist_projects")
+        return {p["id"]: p["name"] for p in projects}
+
+    async def get_projects(self, project_ids: Iterable[str] = ()) -> Dict[str, str]:
+        """Карта проектов из кэша; если среди project_ids есть незнакомый — перезапрашивает"""
+        projects = await project_cache.get(self.token, self._fetch_projects)
+        unknown = {pid for pid in project_ids if pid and pid not in projects}
+        if unknown and not project_cache.is_missing(self.token, unknown):
+            project_cache.invalidate(self.token)
+            projects = await project_cache.get(self.token, self._fetch_projects)
+            project_cache.mark_missing(self.token, unknown - projects.keys())
+        return projects
+
     async def get_active_tasks(self) -> List[TaskInfo]:
-        tasks = self.api.get_tasks()
-        projects = await self.get_projects()
-        
+        tasks = await self._request("GET", f"{TODOIST_REST_URL}/tasks", stage="todoist_tasks")
+        projects = await self.get_projects(t.get("project_id") for t in tasks)
+
         return [
             TaskInfo(
-                content=t.content,
-                project_name=projects.get(t.project_id, "Inbox"),
-                due_date=t.due.string if t.due else None
+                content=t["content"],
+                project_name=projects.get(t.get("project_id"), "Inbox"),
+                due_date=t["due"]["string"] if t.get("due") else None
             )
             for t in tasks
         ]
-    
+
+    async def _get_completed_page(self, params: Dict[str, Any], offset: int) -> List[dict]:
+        data = await self._request(
+            "GET",
+            f"{TODOIST_SYNC_URL}/completed/get_all",
+            stage="todoist_completed_page",
+            params={**params, "limit": COMPLETED_PAGE_SIZE, "offset": offset}
+        )
+        return data.get("items", [])
+
+    async def iter_completed_items(self, since: datetime,
+                                   until: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """Отдаёт сырые элементы completed/get_all постранично, по мере загрузки.
+
+        Первая страница грузится одна; если она полная, следующие страницы
+        запрашиваются пачками по COMPLETED_PAGE_FANOUT параллельно, а отдаются
+        по порядку, пока не придёт неполная страница.
+        """
+        # Todoist читает since/until как UTC
+        params = {"since": to_utc(since).strftime("%Y-%m-%dT%H:%M:%S")}
+        if until:
+            params["until"] = to_utc(until).strftime("%Y-%m-%dT%H:%M:%S")
+
+        items = await self._get_completed_page(params, 0)
+        for item in items:
+            yield item
+        if len(items) < COMPLETED_PAGE_SIZE:
+            return
+
+        offset = COMPLETED_PAGE_SIZE
+        while True:
+            pages = [
+                asyncio.create_task(self._get_completed_page(params, offset + i * COMPLETED_PAGE_SIZE))
+                for i in range(COMPLETED_PAGE_FANOUT)
+            ]
+            try:
+                for page in pages:
+                    items = await page
+                    for item in items:
+                        yield item
+                    if len(items) < COMPLETED_PAGE_SIZE:
+                        return
+            finally:
+                for page in pages:
+                    page.cancel()
+            offset += COMPLETED_PAGE_FANOUT * COMPLETED_PAGE_SIZE
+
+    async def iter_completed_tasks(self, since: datetime,
+                                   until: Optional[datetime] = None) -> AsyncIterator[TaskInfo]:
+        projects_task = asyncio.create_task(self.get_projects())
+        projects = None
+        try:
+            async for item in self.iter_completed_items(since, until):
+                if projects is None:
+                    projects = await projects_task
+                project_id = item.get("project_id", "")
+                if project_id and project_id not in projects:
+                    projects = await self.get_projects([project_id])
+                yield TaskInfo(
+                    content=item["content"],
+                    project_name=projects.get(project_id, "Inbox"),
+                    completed_at=item["completed_at"]
+                )
+        finally:
+            projects_task.cancel()
+
     async def get_completed_tasks(self, since: datetime) -> List[TaskInfo]:
-        headers = {"Authorization": f"Bearer {self.token}"}
-        since_str = since.strftime("%Y-%m-%dT%H:%M:%S")
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://api.todoist.com/sync/v9/completed/get_all",
-                headers=headers,
-                params={"since": since_str}
-            ) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-        
-        projects = await self.get_projects()
-        
-        return [
-            TaskInfo(
-                content=item["content"],
-                project_name=projects.get(item.get("project_id", ""), "Inbox"),
-                completed_at=datetime.fromisoformat(item["completed_at"].replace("Z", "+00:00"))
-            )
-            for item in data.get("items", [])
-        ]
-    
+        try:
+            return [task async for task in self.iter_completed_tasks(since)]
+        except TodoistError:
+            return []
+
     async def get_today_completed(self) -> List[TaskInfo]:
         today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         return await self.get_completed_tasks(today)
-    
+
     async def get_week_completed(self) -> List[TaskInfo]:
         week_ago = datetime.now() - timedelta(days=7)
         return await self.get_completed_tasks(week_ago)
-    
+
     async def get_month_completed(self) -> List[TaskInfo]:
         month_ago = datetime.now() - timedelta(days=30)
         return await self.get_completed_tasks(month_ago)
-    
+
     async def add_task(self, content: str, project_id: Optional[str] = None) -> bool:
         try:
-            kwargs = {"content": content}
+            payload = {"content": content}
             if project_id:
-                kwargs["project_id"] = project_id
-            self.api.add_task(**kwargs)
+                payload["project_id"] = project_id
+            await self._request("POST", f"{TODOIST_REST_URL}/tasks", stage="todoist_add_task", json=payload)
             return True
         except Exception:
             return False
-    
+
+    async def add_tasks(self, contents: List[str], project_id: Optional[str] = None) -> List[AddResult]:
+        """Добавляет задачи пачками через Sync API: один запрос на SYNC_COMMANDS_LIMIT задач.
+
+        Результаты идут в том же порядке, что и contents. Если весь запрос
+        упал, ошибка проставляется каждой задаче из этой пачки.
+        """
+        results = []
+        for start in range(0, len(contents), SYNC_COMMANDS_LIMIT):
+            results.extend(await self._add_tasks_chunk(contents[start:start + SYNC_COMMANDS_LIMIT], project_id))
+        return results
+
+    async def _add_tasks_chunk(self, contents: List[str], project_id: Optional[str]) -> List[AddResult]:
+        commands = []
+        for content in contents:
+            args = {"content": content}
+            if project_id:
+                args["project_id"] = project_id
+            commands.append({
+                "type": "item_add",
+                "uuid": str(uuid.uuid4()),
+                "temp_id": str(uuid.uuid4()),
+                "args": args
+            })
+
+        try:
+            data = await self._request(
+                "POST", f"{TODOIST_SYNC_URL}/sync", stage="todoist_sync_commands", json={"commands": commands}
+            )
+        except (TodoistError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return [AddResult(content, error=str(e)) for content in contents]
+
+        statuses = data.get("sync_status", {})
+        mapping = data.get("temp_id_mapping", {})
+        results = []
+        for content, command in zip(contents, commands):
+            status = statuses.get(command["uuid"])
+            if status == "ok":
+                results.append(AddResult(content, task_id=mapping.get(command["temp_id"], command["temp_id"])))
+            elif isinstance(status, dict):
+                results.append(AddResult(content, error=status.get("error", "unknown error")))
+            else:
+                results.append(AddResult(content, error="no status in response"))
+        return results
+
     async def close_task(self, task_id: str) -> bool:
         try:
-            self.api.close_task(task_id)
+            await self._request("POST", f"{TODOIST_REST_URL}/tasks/{task_id}/close", stage="todoist_close_task")
             return True
         except Exception:
             return False
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bot.config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Сколько ждать незавершённые хендлеры при остановке
+DRAIN_TIMEOUT = 25
+
+
+class WebhookHandler:
+    """Принимает апдейты от Telegram и сразу отвечает 200.
+
+    Обработка апдейта уходит в фоновую задачу, чтобы Telegram не ждал
+    Todoist и Gemini. При остановке новые апдейты получают 503 (Telegram
+    их повторит), а уже начатые дорабатываются в drain(); не успевшие
+    за таймаут отменяются.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str = None):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.accepting = True
+        self._tasks: set = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=401)
+        if not self.accepting:
+            return web.Response(status=503)
+
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        task = asyncio.create_task(self.dp.feed_update(self.bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return web.Response()
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Update handling failed", exc_info=task.exception())
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        self.accepting = False
+        if self._tasks:
+            logger.info("Waiting for %d in-flight updates...", len(self._tasks))
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            if pending:
+                # Дальше закрываются HTTP-сессия и база — не оставляем хендлеры работать без них
+                logger.warning("Cancelling %d updates still running after %ss", len(pending), timeout)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+def create_app(handler: WebhookHandler) -> web.Application:
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handler.handle)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    if not WEBHOOK_URL:
+        logger.error("WEBHOOK_URL not set in .env file")
+        return
+
+    handler = WebhookHandler(dp, bot, WEBHOOK_SECRET)
+    runner = web.AppRunner(create_app(handler))
+    await runner.setup()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dp.emit_startup(bot=bot)
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info("Webhook server listening on %s:%s", WEBAPP_HOST, WEBAPP_PORT)
+
+    try:
+        await stop.wait()
+    finally:
+        await handler.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from bench.fakes import FakeGemini, serve
+from bot import ai_reports
+from bot.handlers.menu import throttled_editor
+from bot.http_session import close_http
+
+TASKS_TEXT = "Проект: Альфа\n- релиз\n\nПроект: Бета\n- баги (x2)"
+CHUNKS = 10
+EDIT_INTERVAL = 0.1
+
+
+class FakeMessage:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_text(self, text: str):
+        self.edits.append((time.monotonic(), text))
+
+
+async def _stream_report(monkeypatch, on_progress):
+    gemini = FakeGemini(chunks=CHUNKS, latency=0.5, jitter=0)
+    runner, url = await serve(gemini.app())
+    monkeypatch.setattr(ai_reports, "GEMINI_API_KEY", "test")
+    monkeypatch.setattr(
+        ai_reports, "GEMINI_STREAM_URL", f"{url}/v1beta/models/gemini-2.5-flash-lite:streamGenerateContent"
+    )
+    try:
+        return await ai_reports.generate_report(TASKS_TEXT, "daily", use_cache=False, on_progress=on_progress)
+    finally:
+        await close_http()
+        await runner.cleanup()
+
+
+def test_generate_report_streams_progress(monkeypatch):
+    progress = []
+
+    async def on_progress(text: str):
+        progress.append(text)
+
+    report = asyncio.run(_stream_report(monkeypatch, on_progress))
+
+    header = ai_reports.get_report_header("daily")
+    assert report.startswith(header)
+    assert "Альфа - " in report and "Бета - " in report
+    assert len(progress) >= 3
+    assert all(text.startswith(header) for text in progress)
+    assert all(len(a) < len(b) and b.startswith(a) for a, b in zip(progress, progress[1:]))
+    assert progress[-1] == report
+
+
+def test_stream_edits_are_throttled(monkeypatch):
+    message = FakeMessage()
+    edit = throttled_editor(message, interval=EDIT_INTERVAL)
+    progress = []
+
+    async def on_progress(text: str):
+        progress.append(text)
+        await edit(text)
+
+    asyncio.run(_stream_report(monkeypatch, on_progress))
+
+    assert 2 <= len(message.edits) < len(progress)
+    times = [at for at, _ in message.edits]
+    assert all(b - a >= EDIT_INTERVAL for a, b in zip(times, times[1:]))
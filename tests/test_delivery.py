@@ -0,0 +1,22 @@
+from bot.delivery import TELEGRAM_MESSAGE_LIMIT, _atoms, split_html
+
+
+def test_atoms_keep_every_character():
+    text = "<b>итог</b> <5 задач, <a href=\"https://x.com\">ссылка</a> и > ещё\n" * 50
+    assert "".join(_atoms(text, TELEGRAM_MESSAGE_LIMIT // 2)) == text
+
+
+def test_lone_less_than_survives_split():
+    text = "итог <5 задач. " * 300
+    parts = split_html(text)
+    assert len(parts) > 1
+    assert "".join(parts).count("<") == text.count("<")
+
+
+def test_link_with_huge_opening_tag_is_kept_as_text():
+    url = "https://x.com/" + "a" * 5000
+    parts = split_html(f"до <a href=\"{url}\">x</a> после")
+    assert all(len(part) <= TELEGRAM_MESSAGE_LIMIT for part in parts)
+    text = "".join(parts)
+    assert "<a" not in text
+    assert text.startswith("до x (https://x.com/") and text.endswith(") после")
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from bench.fakes import FakeTodoist, serve
+from bot import todoist_client
+from bot.http_session import close_http
+from bot.todoist_client import TodoistClient
+
+LATENCY = 0.2
+CALLS = 10
+
+
+async def _timed_calls(monkeypatch, make_call):
+    todoist = FakeTodoist(latency=LATENCY, jitter=0)
+    runner, url = await serve(todoist.app())
+    monkeypatch.setattr(todoist_client, "TODOIST_REST_URL", f"{url}/rest/v2")
+    try:
+        started = time.perf_counter()
+        # У каждого клиента свой токен — иначе get_projects ответит из общего кэша
+        results = await asyncio.gather(*[make_call(TodoistClient(f"token-{i}")) for i in range(CALLS)])
+        elapsed = time.perf_counter() - started
+    finally:
+        await close_http()
+        await runner.cleanup()
+    return results, elapsed, todoist.calls
+
+
+def test_concurrent_get_projects_overlap(monkeypatch):
+    results, elapsed, calls = asyncio.run(_timed_calls(monkeypatch, lambda client: client.get_projects()))
+    assert calls == {"projects": CALLS}
+    assert all(len(projects) == 8 for projects in results)
+    # Последовательно вышло бы CALLS * LATENCY = 2 с, параллельно — около одного запроса
+    assert elapsed < LATENCY * 2
+
+
+def test_concurrent_verify_token_overlap(monkeypatch):
+    results, elapsed, calls = asyncio.run(_timed_calls(monkeypatch, lambda client: client.verify_token()))
+    assert all(results)
+    assert calls == {"projects": CALLS}
+    assert elapsed < LATENCY * 2